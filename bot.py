@@ -4,6 +4,11 @@ Main Bot Application - Entry point for the Telegram bot
 Run this file to start the bot.
 """
 
+import asyncio
+import os
+import re
+import time
+
 import config
 from telegram import Update
 from telegram.ext import (
@@ -20,6 +25,7 @@ from handlers.image import image_handler
 from handlers.size_selection import (
     size_callback_handler,
     custom_size_handler,
+    shutdown_pattern_pool,
     WAITING_CUSTOM_SIZE
 )
 from handlers.step_mode import (
@@ -28,6 +34,66 @@ from handlers.step_mode import (
     step_color_edit_handler
 )
 
+# === CALLBACK ROUTES ===
+# Compiled once here; CallbackQueryHandler uses a compiled pattern as-is
+SIZE_RE = re.compile(r"^size_")
+START_STEP_MODE_RE = re.compile(r"^start_step_mode$")
+EXPORT_PDF_RE = re.compile(r"^export_pdf$")
+NEW_PATTERN_RE = re.compile(r"^new_pattern$")
+STEP_NAV_RE = re.compile(r"^step_(next|prev|end)$")
+STEP_COLOR_RE = re.compile(r"^(step_color_edit|color_)")
+STEP_JUMP_RE = re.compile(r"^step_jump$")
+
+
+# === TEMP FILE CLEANUP ===
+TEMP_CLEANUP_INTERVAL = 3600  # Seconds between TEMP_DIR sweeps
+
+
+def _cleanup_temp_dir(max_age):
+    """Delete TEMP_DIR files not modified in the last max_age seconds"""
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = os.scandir(config.TEMP_DIR)
+    except FileNotFoundError:
+        return 0
+    
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass  # Vanished or in use - try again next sweep
+    return removed
+
+
+async def _temp_cleanup_loop():
+    """
+    Sweep TEMP_DIR periodically.
+    
+    Step mode bumps the mtime of a session's files each time it shows a step,
+    so only files left idle for SESSION_TIMEOUT_HOURS are removed; handlers
+    that find them gone answer with ERROR_MESSAGES['no_session'].
+    """
+    max_age = config.SESSION_TIMEOUT_HOURS * 3600
+    while True:
+        removed = await asyncio.to_thread(_cleanup_temp_dir, max_age)
+        if removed:
+            config.logger.info(f"Temp cleanup removed {removed} files")
+        await asyncio.sleep(TEMP_CLEANUP_INTERVAL)
+
+
+async def _post_init(app):
+    """Start background tasks once the application is running"""
+    app.create_task(_temp_cleanup_loop())
+
+
+async def _post_shutdown(app):
+    """Release worker processes once the application has stopped"""
+    shutdown_pattern_pool()
+
 
 def main():
     """Start the bot"""
@@ -39,8 +105,11 @@ def main():
     
     print("🤖 Starting Crochet Pattern Bot...")
     
+    # Handlers write into TEMP_DIR and assume it exists
+    os.makedirs(config.TEMP_DIR, exist_ok=True)
+    
     # Create application
-    app = Application.builder().token(config.BOT_TOKEN).build()
+    app = Application.builder().token(config.BOT_TOKEN).post_init(_post_init).post_shutdown(_post_shutdown).build()
     
     # === COMMAND HANDLERS ===
     app.add_handler(CommandHandler("start", start_command))
@@ -52,7 +121,7 @@ def main():
     
     # === SIZE SELECTION WITH CONVERSATION (for custom size) ===
     size_conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(size_callback_handler, pattern="^size_")],
+        entry_points=[CallbackQueryHandler(size_callback_handler, pattern=SIZE_RE)],
         states={
             WAITING_CUSTOM_SIZE: [MessageHandler(filters.TEXT & ~filters.COMMAND, custom_size_handler)]
         },
@@ -62,23 +131,23 @@ def main():
     app.add_handler(size_conv_handler)
     
     # === MAIN MENU CALLBACKS ===
-    app.add_handler(CallbackQueryHandler(start_step_mode, pattern="^start_step_mode$"))
+    app.add_handler(CallbackQueryHandler(start_step_mode, pattern=START_STEP_MODE_RE))
     
     # PDF Export
     from handlers.pdf_export import export_pdf_handler
-    app.add_handler(CallbackQueryHandler(export_pdf_handler, pattern="^export_pdf$"))
+    app.add_handler(CallbackQueryHandler(export_pdf_handler, pattern=EXPORT_PDF_RE))
     
-    app.add_handler(CallbackQueryHandler(new_pattern_command, pattern="^new_pattern$"))
+    app.add_handler(CallbackQueryHandler(new_pattern_command, pattern=NEW_PATTERN_RE))
     
     # === STEP MODE CALLBACKS ===
-    app.add_handler(CallbackQueryHandler(step_navigation_handler, pattern="^step_(next|prev|end)$"))
-    app.add_handler(CallbackQueryHandler(step_color_edit_handler, pattern="^(step_color_edit|color_)"))
+    app.add_handler(CallbackQueryHandler(step_navigation_handler, pattern=STEP_NAV_RE))
+    app.add_handler(CallbackQueryHandler(step_color_edit_handler, pattern=STEP_COLOR_RE))
 
     # === STEP JUMP CONVERSATION ===
     from handlers.step_mode import jump_to_step_prompt, jump_to_step_handler
     
     step_jump_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(jump_to_step_prompt, pattern="^step_jump$")],
+        entry_points=[CallbackQueryHandler(jump_to_step_prompt, pattern=STEP_JUMP_RE)],
         states={
             1: [MessageHandler(filters.TEXT & ~filters.COMMAND, jump_to_step_handler)]
         },
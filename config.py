@@ -22,6 +22,7 @@ MAX_COLORS = 10
 # Bot behavior
 RATE_LIMIT_PATTERNS_PER_HOUR = 5
 SESSION_TIMEOUT_HOURS = 24
+STEP_PREBUILD_AHEAD = 10  # Step composites rendered in the background ahead of the user
 
 # Error messages (Arabic)
 ERROR_MESSAGES = {
@@ -1,10 +1,15 @@
 """Core module initialization - Independent image-to-pattern conversion logic"""
 
-from .image_analyzer import analyze_image_complexity
-from .pattern_gen import PatternGenerator
-from .step_generator import StepGenerator
-from .composite_img import CompositeImageCreator
-from .session import SessionManager
+import importlib
+
+# Public name -> (submodule, attribute); submodules load on first access
+_LAZY_EXPORTS = {
+    'analyze_image_complexity': ('.image_analyzer', 'analyze_image_complexity'),
+    'PatternGenerator': ('.pattern_gen', 'PatternGenerator'),
+    'StepGenerator': ('.step_generator', 'StepGenerator'),
+    'CompositeImageCreator': ('.composite_img', 'CompositeImageCreator'),
+    'SessionManager': ('.session', 'SessionManager'),
+}
 
 __all__ = [
     'analyze_image_complexity',
@@ -13,3 +18,18 @@ __all__ = [
     'CompositeImageCreator',
     'SessionManager',
 ]
+
+
+def __getattr__(name):
+    try:
+        module_name, attr = _LAZY_EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(importlib.import_module(module_name, __name__), attr)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
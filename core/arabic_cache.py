@@ -0,0 +1,70 @@
+"""
+Arabic Cache - Memoized Arabic reshaping and BiDi
+
+arabic_reshaper and python-bidi are pure functions of the input string, so
+each distinct label (color names, row headers) only pays for them once.
+"""
+
+import re
+from functools import lru_cache
+
+from arabic_reshaper import ArabicReshaper
+from bidi.algorithm import get_display
+
+# One reshaper for every call. Default configuration, so output matches
+# arabic_reshaper.reshape; reshape() still reads its config options on
+# every call, which the caches below skip for repeated strings
+_RESHAPER = ArabicReshaper()
+
+# Arabic letters, tatweel and spaces only. For these the BiDi algorithm is a
+# plain reversal; digits, punctuation and combining marks are all reordered
+# differently, so anything else goes through get_display
+_PURE_RTL = re.compile(r'[\u0621-\u063A\u0640-\u064A\u0671-\u06D3 ]*')
+
+
+@lru_cache(maxsize=1024)
+def reshape(text):
+    """Connect Arabic letters (no BiDi reordering)"""
+    return _RESHAPER.reshape(text)
+
+
+@lru_cache(maxsize=4096)
+def shape_arabic(text):
+    """
+    Reshape text and apply the BiDi algorithm.
+
+    Shared by every image and PDF label, so one cache serves them all. If
+    shaping fails the text is returned unchanged, as process.text_arabic does.
+
+    Returns:
+        tuple: (reshaped, final) - final is ready to draw left-to-right
+    """
+    if text.isascii() and text.isprintable():
+        # Plain Latin text - reshaping and BiDi leave it as is
+        return text, text
+    try:
+        reshaped = reshape(text)
+        if _PURE_RTL.fullmatch(text):
+            return reshaped, reshaped[::-1]
+        return reshaped, get_display(reshaped)
+    except Exception as e:
+        print(f"⚠️ WARNING: Arabic text processing failed: {e}")
+        print(f"  Text: {text}")
+        print(f"  Returning original text")
+        return text, text
+
+
+@lru_cache(maxsize=64)
+def _shape_batch(texts):
+    """shape_many() cache - keyed on the whole tuple of texts"""
+    return tuple(shape_arabic(text)[1] for text in texts)
+
+
+def shape_many(texts):
+    """
+    Shape a batch of labels (e.g. a whole palette legend) in one call.
+
+    Returns:
+        list: final, ready-to-draw form of each text, in order
+    """
+    return list(_shape_batch(tuple(texts)))
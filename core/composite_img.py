@@ -3,8 +3,109 @@ Composite Image Creator - COMPLETE REWRITE
 Simple, clear logic for step-by-step visual guides
 """
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import logging
 import os
+import threading
+
+import numpy as np
+
+from core.arabic_cache import shape_arabic
+from process import FONT_PATH, STANDARD_YARN_PALETTE, load_font
+
+logger = logging.getLogger(__name__)
+
+# One reusable composite canvas per thread, cleared between steps
+_CANVAS_POOL = threading.local()
+
+# Scratch surface for measuring text without a real canvas
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+
+@lru_cache(maxsize=4096)
+def _text_width(text, font):
+    """
+    Rendered width of already-shaped text in the given font.
+    
+    Ink extents (textbbox), not font.getlength - the advance width includes
+    side bearings and would shift the centered text.
+    """
+    bbox = _MEASURE_DRAW.textbbox((0, 0), text, font=font)
+    return bbox[2] - bbox[0]
+
+
+def _grid_to_indexed(pattern_grid):
+    """
+    Convert a grid of color names to palette indices.
+    
+    Returns:
+        tuple: ((H, W) uint8 index array, (N, 3) uint8 palette)
+    """
+    if len(pattern_grid) == 0:
+        return np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 3), dtype=np.uint8)
+    
+    # Only the named yarn colors can appear, so N always fits in a byte
+    names, inverse = np.unique(np.asarray(pattern_grid), return_inverse=True)
+    palette = np.array(
+        [STANDARD_YARN_PALETTE.get(name, (0, 0, 0)) for name in names],
+        dtype=np.uint8
+    )
+    indices = inverse.reshape(len(pattern_grid), -1).astype(np.uint8)
+    return indices, palette
+
+
+# Prepared per-pattern state shared by creators for the same pattern_id
+# (e.g. re-entering step mode for a session), least recently used first
+_PREP_CACHE_SIZE = 16
+_PREP_CACHE = OrderedDict()
+_prep_lock = threading.Lock()
+
+
+def _prepare(pattern_grid, original_image, ref_size):
+    """Build the per-pattern buffers every step render reads from"""
+    pattern_idx, palette = _grid_to_indexed(pattern_grid)
+    
+    # Reference thumbnail is the same for every step - only the box moves
+    ref_base = original_image.copy()
+    ref_base.thumbnail(ref_size, Image.Resampling.LANCZOS)
+    
+    return {
+        'pattern_idx': pattern_idx,
+        'palette': palette,
+        'ref_base': ref_base.convert('RGB'),
+    }
+
+
+def invalidate_prepared(pattern_id=None):
+    """
+    Drop prepared state for a pattern (or all patterns if None).
+    
+    Call this whenever the pattern grid behind pattern_id changes.
+    """
+    with _prep_lock:
+        if pattern_id is None:
+            _PREP_CACHE.clear()
+        else:
+            _PREP_CACHE.pop(pattern_id, None)
+
+
+# Creator used by the current worker process in create_all()
+_worker_creator = None
+
+
+def _init_worker(creator):
+    """Receive the (unpickled) creator once per worker process"""
+    global _worker_creator
+    _worker_creator = creator
+
+
+def _render_step(step):
+    """Render one step in a worker process"""
+    return _worker_creator.create_step_image(step)
+
 
 class CompositeImageCreator:
     """Creates visual guides for crochet steps"""
@@ -12,37 +113,111 @@ class CompositeImageCreator:
     COMPOSITE_SIZE = (800, 900)  # Width x Height
     REF_SIZE = (150, 150)  # Reference image size
     GRID_CELL_SIZE = 20  # Grid cells are 20x20 pixels
+    BACKGROUND_COLOR = (245, 245, 245)  # Light grey
+    GRID_LINE_COLOR = (200, 200, 200)
+    HIGHLIGHT_COLOR = (255, 255, 0)  # Yellow
+    HIGHLIGHT_WIDTH = 6
+    ZOOM_ROWS = 50  # Rows shown in the zoomed grid (and boxed on the reference)
     
-    def __init__(self, grid_image, original_image, pattern_grid, pattern_image=None):
+    def __init__(self, grid_image, original_image, pattern_grid, pattern_image=None,
+                 pattern_id=None):
         """
         Args:
             grid_image: PIL Image of the grid pattern (with colors and grid lines)  
             original_image: PIL Image of the original photo
-            pattern_grid: 2D array of (r,g,b) tuples representing the pattern
-            pattern_image: PIL Image of pattern WITHOUT grid lines (for zooming)
+            pattern_grid: 2D array of color names representing the pattern
+            pattern_image: PIL Image of pattern WITHOUT grid lines (1px per cell)
+            pattern_id: Optional key (e.g. session ID) to reuse prepared state
+                across creators; see invalidate_prepared()
         """
         self.grid_image = grid_image
         self.original_image = original_image
         self.pattern_grid = pattern_grid
         
-        # Use pattern_image for zooming if provided, otherwise fall back to grid
-        self.pattern_image = pattern_image if pattern_image is not None else grid_image
-        
-        self.height = len(pattern_grid)  # Number of rows
-        self.width = len(pattern_grid[0]) if pattern_grid else 0  # Number of columns
-        
-        # Load font
-        try:
-            from process import FONT_PATH
-            if FONT_PATH and os.path.exists(FONT_PATH):
-                self.font_large = ImageFont.truetype(FONT_PATH, 28)
-                self.font_medium = ImageFont.truetype(FONT_PATH, 22)
-            else:
-                self.font_large = ImageFont.load_default()
-                self.font_medium = ImageFont.load_default()
-        except Exception as e:
-            self.font_large = ImageFont.load_default()
-            self.font_medium = ImageFont.load_default()
+        prepared = self._get_prepared(pattern_id)
+        
+        # 1 byte per stitch plus a small palette - zooms are sliced and
+        # scaled as indices and only expanded to RGB at the end
+        self.pattern_idx = prepared['pattern_idx']
+        self.palette = prepared['palette']
+        self.height, self.width = self.pattern_idx.shape  # Rows, columns
+        self._ref_base = prepared['ref_base']
+        
+        if pattern_image is None:
+            pattern_image = Image.fromarray(self.palette[self.pattern_idx])
+        self.pattern_image = pattern_image
+        
+        # Last scaled zoom section (with grid lines), reused while the
+        # window bounds stay the same - consecutive steps share a row
+        self._zoom_key = None
+        self._zoom_cache = None
+        
+        # Same for the boxed reference thumbnail, keyed by the boxed rows
+        self._ref_key = None
+        self._ref_cache = None
+        
+        # Load fonts (shared across instances)
+        self._load_fonts()
+    
+    def _get_prepared(self, pattern_id):
+        """Look up (or build and cache) the prepared state for this pattern"""
+        if pattern_id is None:
+            return _prepare(self.pattern_grid, self.original_image, self.REF_SIZE)
+        
+        with _prep_lock:
+            prepared = _PREP_CACHE.get(pattern_id)
+            if prepared is not None:
+                _PREP_CACHE.move_to_end(pattern_id)
+                return prepared
+        
+        prepared = _prepare(self.pattern_grid, self.original_image, self.REF_SIZE)
+        with _prep_lock:
+            _PREP_CACHE[pattern_id] = prepared
+            if len(_PREP_CACHE) > _PREP_CACHE_SIZE:
+                _PREP_CACHE.popitem(last=False)
+        return prepared
+    
+    def _load_fonts(self):
+        self.font_large = load_font(FONT_PATH, 28)
+        self.font_medium = load_font(FONT_PATH, 22)
+    
+    def __getstate__(self):
+        # Fonts are reloaded in the receiving process; the grid and full-size
+        # original images are never needed for rendering
+        state = self.__dict__.copy()
+        del state['font_large'], state['font_medium']
+        state['grid_image'] = None
+        state['original_image'] = None
+        state['_zoom_key'] = state['_zoom_cache'] = None
+        state['_ref_key'] = state['_ref_cache'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load_fonts()
+    
+    def create_all(self, steps, max_workers=None, chunksize=8):
+        """
+        Render step images for many steps in parallel worker processes.
+        
+        Args:
+            steps: Iterable of step dictionaries
+            max_workers: Number of worker processes (default: CPU count)
+            chunksize: Steps sent to a worker per round-trip
+        
+        Returns:
+            list: PIL Images in the same order as steps
+        """
+        steps = list(steps)
+        if len(steps) <= 1:
+            return [self.create_step_image(step) for step in steps]
+        
+        with ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(self,)
+        ) as executor:
+            return list(executor.map(_render_step, steps, chunksize=chunksize))
     
     def create_step_image(self, step):
         """
@@ -56,8 +231,13 @@ class CompositeImageCreator:
         Args:
             step: Dictionary with row, start_col, end_col, color_name, instruction_ar
         """
-        # Create canvas
-        canvas = Image.new('RGB', self.COMPOSITE_SIZE, (245, 245, 245))  # Light grey background
+        # Reuse this thread's canvas - clearing it is cheaper than a fresh allocation
+        canvas = getattr(_CANVAS_POOL, 'canvas', None)
+        if canvas is None or canvas.size != self.COMPOSITE_SIZE:
+            canvas = Image.new('RGB', self.COMPOSITE_SIZE, self.BACKGROUND_COLOR)
+            _CANVAS_POOL.canvas = canvas
+        else:
+            canvas.paste(self.BACKGROUND_COLOR, (0, 0, *self.COMPOSITE_SIZE))
         draw = ImageDraw.Draw(canvas)
         
         # === 1. REFERENCE IMAGE WITH POSITION BOX ===
@@ -65,19 +245,15 @@ class CompositeImageCreator:
         canvas.paste(ref_img, (325, 20))  # Centered horizontally
         
         # === 2. STEP TEXT ===
-        from process import text_arabic
-        
         # Header text
         header = f"📍 الصف {step['row']} - الخطوة {step['step_number']}"
-        header_ar = text_arabic(header)
-        bbox = draw.textbbox((0, 0), header_ar, font=self.font_large)
-        text_w = bbox[2] - bbox[0]
+        header_ar = shape_arabic(header)[1]
+        text_w = _text_width(header_ar, self.font_large)
         draw.text((400 - text_w//2, 190), header_ar, fill='black', font=self.font_large)
         
         # Instruction text
-        instr_ar = text_arabic(step['instruction_ar'])
-        bbox = draw.textbbox((0, 0), instr_ar, font=self.font_medium)
-        text_w = bbox[2] - bbox[0]
+        instr_ar = shape_arabic(step['instruction_ar'])[1]
+        text_w = _text_width(instr_ar, self.font_medium)
         draw.text((400 - text_w//2, 220), instr_ar, fill=(50, 50, 50), font=self.font_medium)
         
         # ===  3. ZOOMED GRID ===
@@ -87,26 +263,21 @@ class CompositeImageCreator:
         paste_x = (800 - zoomed_grid.width) // 2
         canvas.paste(zoomed_grid, (paste_x, 260))
         
-        return canvas
+        # Callers keep the image (e.g. while it is sent), so hand out a copy
+        return canvas.copy()
     
     def _create_reference_with_box(self, step):
         """
         Create reference image with red box showing which area is zoomed.
         
         The red box should match the exact rows being shown in the zoomed section.
+        The result is cached and shared - callers must not draw on it.
         """
-        # Resize original image to fit
-        ref = self.original_image.copy()
-        ref.thumbnail(self.REF_SIZE, Image.Resampling.LANCZOS)
-        ref = ref.convert('RGB')
-        
-        draw = ImageDraw.Draw(ref)
-        
         # Calculate which rows we'll show in zoom (we show ±25 rows around current)
         current_row = step['row'] - 1  # 0-indexed
         
         # Show 50 rows total centered on current row
-        zoom_rows = 50
+        zoom_rows = self.ZOOM_ROWS
         half_zoom = zoom_rows // 2
         
         min_row = max(0, current_row - half_zoom)
@@ -116,6 +287,16 @@ class CompositeImageCreator:
         if max_row == self.height:
             min_row = max(0, max_row - zoom_rows)
         
+        # Only the box position varies, and steps in nearby rows share it
+        ref_key = (min_row, max_row)
+        if ref_key == self._ref_key:
+            return self._ref_cache
+        
+        # Copy the pre-sized thumbnail (150x150 at most)
+        ref = self._ref_base.copy()
+        
+        draw = ImageDraw.Draw(ref)
+        
         # Draw red box showing these rows
         # Convert row positions to pixel positions on reference image
         box_top = int((min_row / self.height) * ref.height)
@@ -134,6 +315,8 @@ class CompositeImageCreator:
             width=2
         )
         
+        self._ref_key = ref_key
+        self._ref_cache = ref
         return ref
     
     def _create_zoomed_grid_v2(self, step):
@@ -156,12 +339,13 @@ class CompositeImageCreator:
             # These are reversed coordinates - convert to original
             step_start_col = self.width - step['end_col']
             step_end_col = self.width - step['start_col']
-            print(f"DEBUG V2: LEFT zoom - converted {step['start_col']}-{step['end_col']} to {step_start_col}-{step_end_col}")
+            logger.debug("V2: LEFT zoom - converted %s-%s to %s-%s",
+                         step['start_col'], step['end_col'], step_start_col, step_end_col)
         
         mid_col = (step_start_col + step_end_col) // 2
         
         # Decide how much to show
-        zoom_rows = min(50, self.height)
+        zoom_rows = min(self.ZOOM_ROWS, self.height)
         zoom_cols = min(40, self.width)
         
         # Center on current position
@@ -183,47 +367,18 @@ class CompositeImageCreator:
         if max_col == self.width:
             min_col = max(0, max_col - zoom_cols)
         
-        print(f"DEBUG V2: Row {step['row']}, showing rows {min_row}-{max_row}, cols {min_col}-{max_col}")
+        logger.debug("V2: Row %s, showing rows %s-%s, cols %s-%s",
+                     step['row'], min_row, max_row, min_col, max_col)
         
-        # ==== CROP FROM PATTERN IMAGE (no grid lines) ====
-        # Pattern image is 1 pixel per cell
-        crop_box = (
-            min_col,  # Pattern is 1px per cell
-            min_row,
-            max_col,
-            max_row
-        )
-        
-        # Crop the pattern (color cells only, no grid)
-        pattern_section = self.pattern_image.crop(crop_box)
-        print(f"DEBUG V2: Cropped pattern size: {pattern_section.size}")
-        
-        # Scale up to make cells visible (20px per cell minimum)
         cell_size_scaled = 20  # Each cell becomes 20x20 pixels
-        scaled_size = (
-            pattern_section.width * cell_size_scaled,
-            pattern_section.height * cell_size_scaled
-        )
-        
-        zoomed = pattern_section.resize(scaled_size, Image.Resampling.NEAREST)
-        print(f"DEBUG V2: Scaled to: {zoomed.size}")
         
-        # Now add grid lines on the scaled image
-        draw_grid = ImageDraw.Draw(zoomed)
-        grid_color = (200, 200, 200)
+        zoom_key = (min_row, max_row, min_col, max_col)
+        if zoom_key != self._zoom_key:
+            self._zoom_cache = self._build_zoom_section(zoom_key, cell_size_scaled)
+            self._zoom_key = zoom_key
         
-        # Vertical lines
-        for x in range(0, zoomed.width, cell_size_scaled):
-            draw_grid.line([(x, 0), (x, zoomed.height)], fill=grid_color, width=1)
-        
-        # Horizontal lines  
-        for y in range(0, zoomed.height, cell_size_scaled):
-            draw_grid.line([(0, y), (zoomed.width, y)], fill=grid_color, width=1)
-        
-        # Draw yellow highlight on current step
-        zoomed_rgba = zoomed.convert('RGBA')
-        overlay = Image.new('RGBA', zoomed_rgba.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+        # Copy so the yellow box never lands on the cached section
+        zoomed = self._zoom_cache.copy()
         
         # Calculate where current step is in the zoomed view
         local_row = current_row - min_row
@@ -246,17 +401,41 @@ class CompositeImageCreator:
         
         # Only draw if there's something visible (row is visible and there's width)
         if (0 <= local_row < (max_row - min_row) and x_end > x_start):
-            print(f"DEBUG V2: Yellow box at ({x_start:.0f}, {y:.0f}), size ({x_end-x_start:.0f}×{cell_h:.0f})")
+            logger.debug("V2: Yellow box at (%.0f, %.0f), size (%.0f×%.0f)",
+                         x_start, y, x_end - x_start, cell_h)
             
-            # Draw thick yellow outline
-            draw.rectangle(
-                [x_start, y, x_end, y + cell_h],
-                outline='yellow',
-                width=6  # Thick and visible!
-            )
+            # Thick yellow outline as four slice writes. Same pixels as
+            # ImageDraw.rectangle([x_start, y, x_end, y + cell_h], width=6):
+            # corners inclusive, border grows inward, clipped at the edges
+            w = self.HIGHLIGHT_WIDTH
+            x1, y1 = x_end + 1, y + cell_h + 1  # Exclusive bounds
+            zoomed[y:y + w, x_start:x1] = self.HIGHLIGHT_COLOR  # Top
+            zoomed[y1 - w:y1, x_start:x1] = self.HIGHLIGHT_COLOR  # Bottom
+            zoomed[y:y1, x_start:x_start + w] = self.HIGHLIGHT_COLOR  # Left
+            zoomed[y:y1, x1 - w:x1] = self.HIGHLIGHT_COLOR  # Right
         else:
-            print(f"DEBUG V2: Step not in zoomed view (row {local_row}, x_start {x_start}, x_end {x_end})")
+            logger.debug("V2: Step not in zoomed view (row %s, x_start %s, x_end %s)",
+                         local_row, x_start, x_end)
         
-        # Composite and return
-        result = Image.alpha_composite(zoomed_rgba, overlay)
-        return result.convert('RGB')
+        return Image.fromarray(zoomed)
+    
+    def _build_zoom_section(self, bounds, cell_size_scaled):
+        """Crop, scale up and grid one zoom window as an (H, W, 3) array (no highlight)"""
+        min_row, max_row, min_col, max_col = bounds
+        
+        # ==== CROP FROM PATTERN CELLS (no grid lines) ====
+        # Index array is 1 cell per pixel, so the crop is a plain slice
+        section = self.pattern_idx[min_row:max_row, min_col:max_col]
+        logger.debug("V2: Cropped pattern size: %s", section.shape[::-1])
+        
+        # Scale up to make cells visible (20px per cell minimum): repeat the
+        # 1-byte indices, then expand to RGB in a single palette gather
+        scaled = np.repeat(np.repeat(section, cell_size_scaled, axis=0), cell_size_scaled, axis=1)
+        zoomed = self.palette[scaled]
+        logger.debug("V2: Scaled to: %s", scaled.shape[::-1])
+        
+        # Add grid lines: one pixel every cell_size_scaled in both directions
+        zoomed[::cell_size_scaled, :] = self.GRID_LINE_COLOR
+        zoomed[:, ::cell_size_scaled] = self.GRID_LINE_COLOR
+        
+        return zoomed
@@ -7,16 +7,32 @@ This module analyzes uploaded images to determine:
 - Recommended size range
 """
 
-from PIL import Image, ImageFilter
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
 import numpy as np
 
+# Results of previous analyses, keyed by a hash of the file content
+_CACHE_SIZE = 128
+_HASH_BLOCK = 64 * 1024
+_analysis_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
 
 def analyze_image_complexity(image_path):
     """
     Analyze image to recommend optimal grid size.
     
+    Results are cached by file content, so re-sending the same photo
+    skips the decode and both metrics.
+    
     Args:
-        image_path (str): Path to the image file
+        image_path (str or bytes): Path to the image file, or its
+            encoded content (e.g. a download kept in memory)
     
     Returns:
         dict: {
@@ -28,15 +44,75 @@ def analyze_image_complexity(image_path):
             'stats': dict  # Additional statistics
         }
     """
+    key = _content_key(image_path)
+    
+    with _cache_lock:
+        result = _analysis_cache.get(key)
+        if result is not None:
+            _analysis_cache.move_to_end(key)
+    
+    if result is None:
+        result = _analyze(image_path)
+        with _cache_lock:
+            _analysis_cache[key] = result
+            if len(_analysis_cache) > _CACHE_SIZE:
+                _analysis_cache.popitem(last=False)
+    
+    # Copy so callers can't mutate the cached entry
+    return {**result, 'stats': dict(result['stats'])}
+
+
+def clear_analysis_cache():
+    """Forget all cached analysis results"""
+    with _cache_lock:
+        _analysis_cache.clear()
+
+
+def _content_key(image_path):
+    """Fast content hash: first and last 64 KiB plus the file size"""
+    digest = hashlib.blake2b(digest_size=16)
+    
+    if isinstance(image_path, (bytes, bytearray, memoryview)):
+        data = memoryview(image_path)
+        size = len(data)
+        digest.update(data[:_HASH_BLOCK])
+        if size > _HASH_BLOCK:
+            start = max(size - _HASH_BLOCK, _HASH_BLOCK)
+            digest.update(data[start:start + _HASH_BLOCK])
+        digest.update(size.to_bytes(8, 'little'))
+        return digest.hexdigest()
+    
+    size = os.path.getsize(image_path)
+    with open(image_path, 'rb') as f:
+        digest.update(f.read(_HASH_BLOCK))
+        if size > _HASH_BLOCK:
+            f.seek(max(size - _HASH_BLOCK, _HASH_BLOCK))
+            digest.update(f.read(_HASH_BLOCK))
+    
+    digest.update(size.to_bytes(8, 'little'))
+    return digest.hexdigest()
+
+
+def _analyze(image_path):
+    """Run the full analysis (uncached)"""
     # Load image
+    if isinstance(image_path, (bytes, bytearray, memoryview)):
+        image_path = io.BytesIO(image_path)
     img = Image.open(image_path).convert('RGB')
     width, height = img.size
     
+    # Resize once in place - both metrics work on the same small image
+    img.thumbnail((400, 400), Image.Resampling.BILINEAR)
+    
     # Calculate color complexity
     color_complexity = _calculate_color_complexity(img)
     
-    # Calculate edge density
-    edge_density = _calculate_edge_density(img)
+    # Calculate edge density - unless the image is so small that every
+    # complexity band clamps to the same size; then colors stand in for it
+    if _determine_size(width, height, 0.0, 0.0)[1] == _determine_size(width, height, 1.0, 1.0)[1]:
+        edge_density = color_complexity
+    else:
+        edge_density = _calculate_edge_density(img)
     
     # Determine detail level and recommended size
     detail_level, recommended = _determine_size(
@@ -58,18 +134,23 @@ def analyze_image_complexity(image_path):
 
 def _calculate_color_complexity(img):
     """Calculate number of distinct colors (complexity metric)"""
-    # Resize for faster analysis
-    img_small = img.copy()
-    img_small.thumbnail((200, 200))
-    
-    # Count unique colors
-    colors = img_small.getcolors(maxcolors=100000)
-    
-    if colors is None:
-        # Too many colors
-        return 1.0
+    # Half of the 400px working image is enough for counting colors
+    img_small = img.resize(
+        (max(1, img.width // 2), max(1, img.height // 2)),
+        Image.Resampling.NEAREST
+    )
     
-    unique_count = len(colors)
+    # Count unique colors on a 5-bit-per-channel view, packed into uint16
+    arr = np.asarray(img_small, dtype=np.uint8)
+    packed = (
+        (arr[..., 0] >> 3).astype(np.uint16)
+        | ((arr[..., 1] >> 3).astype(np.uint16) << 5)
+        | ((arr[..., 2] >> 3).astype(np.uint16) << 10)
+    )
+    # bincount over the fixed 32768-bin key space is O(n), no sort needed
+    unique_count = int(np.count_nonzero(
+        np.bincount(packed.ravel(), minlength=1 << 15)
+    ))
     
     # Normalize to 0-1 range
     # 0-100 colors = simple (0.0-0.3)
@@ -84,22 +165,25 @@ def _calculate_color_complexity(img):
 
 
 def _calculate_edge_density(img):
-    """Calculate edge density using simple filter (complexity metric)"""
-    # Convert to grayscale
+    """Calculate edge density using an 8-neighbour Laplacian (complexity metric)"""
+    # Convert to grayscale (img is already the 400px working image)
     grey = img.convert('L')
-    
-    # Resize for faster processing
-    grey.thumbnail((400, 400))
-    
-    # Apply edge detection filter
-    edges = grey.filter(ImageFilter.FIND_EDGES)
-    
-    # Convert to numpy for analysis
-    edge_array = np.array(edges)
-    
-    # Count edge pixels (bright pixels in edge image)
-    edge_pixels = np.sum(edge_array > 30)  # Threshold
-    total_pixels = edge_array.size
+    a = np.asarray(grey, dtype=np.int16)
+    
+    # Same response as PIL's FIND_EDGES: 8*centre - neighbours, from a 3x3
+    # box sum built with two shifted-add passes. FIND_EDGES keeps the border
+    # pixels unfiltered, so they are compared as-is
+    edges = a.copy()
+    edge_pixels = 0
+    if a.shape[0] >= 3 and a.shape[1] >= 3:
+        col = a[:-2] + a[1:-1] + a[2:]
+        box = col[:, :-2] + col[:, 1:-1] + col[:, 2:]
+        edge_pixels += int(((9 * a[1:-1, 1:-1] - box) > 30).sum())  # Threshold
+        edges[1:-1, 1:-1] = 0
+    
+    # Count edge pixels (strong responses)
+    edge_pixels += int((edges > 30).sum())
+    total_pixels = a.size
     
     density = edge_pixels / total_pixels
     
@@ -4,9 +4,16 @@ Keyboard Layouts - Inline keyboards for bot interactions
 Defines all button layouts used in the bot.
 """
 
+from functools import lru_cache
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from process import STANDARD_YARN_PALETTE
+
 
+# InlineKeyboardMarkup is frozen after construction, so one instance can be
+# shared by every message that needs the same layout
+@lru_cache(maxsize=256)
 def get_size_selection_keyboard(recommended_size, min_size, max_size):
     """
     Get keyboard for size selection based on image analysis.
@@ -38,14 +45,15 @@ def get_size_selection_keyboard(recommended_size, min_size, max_size):
     return InlineKeyboardMarkup(keyboard)
 
 
+_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎯 الخطوات بالتسلسل", callback_data="start_step_mode")],
+    [InlineKeyboardButton("📄 تحميل ملف PDF", callback_data="export_pdf")],
+])
+
+
 def get_main_menu_keyboard():
     """Main menu after pattern is generated"""
-    keyboard = [
-        [InlineKeyboardButton("🎯 الخطوات بالتسلسل", callback_data="start_step_mode")],
-        [InlineKeyboardButton("📄 تحميل ملف PDF", callback_data="export_pdf")],
-    ]
-    
-    return InlineKeyboardMarkup(keyboard)
+    return _MAIN_MENU_KEYBOARD
 
 
 def get_step_navigation_keyboard(current_step, total_steps):
@@ -74,23 +82,9 @@ def get_step_navigation_keyboard(current_step, total_steps):
     return InlineKeyboardMarkup(keyboard)
 
 
-def get_color_picker_keyboard(available_colors, show_all=False):
-    """
-    Keyboard for color selection.
-    
-    Args:
-        available_colors (list): List of color names
-        show_all (bool): If True, show all colors from palette
-    """
-    from process import STANDARD_YARN_PALETTE
-    
-    if show_all:
-        # Show all colors from standard palette
-        colors_to_show = list(STANDARD_YARN_PALETTE.keys())
-    else:
-        # Show only colors used in this pattern
-        colors_to_show = available_colors
-    
+@lru_cache(maxsize=256)
+def _build_color_picker_keyboard(colors_to_show, show_more):
+    """Color picker layout for a tuple of color names"""
     # Create keyboard with 3 colors per row
     keyboard = []
     row = []
@@ -110,7 +104,7 @@ def get_color_picker_keyboard(available_colors, show_all=False):
         keyboard.append(row)
     
     # Add "Show More" or "Cancel" button
-    if not show_all and len(available_colors) < 10:
+    if show_more:
         keyboard.append([InlineKeyboardButton("عرض المزيد 📋", callback_data="color_show_all")])
     
     keyboard.append([InlineKeyboardButton("إلغاء ❌", callback_data="color_cancel")])
@@ -118,16 +112,37 @@ def get_color_picker_keyboard(available_colors, show_all=False):
     return InlineKeyboardMarkup(keyboard)
 
 
+# The full palette never changes, so its picker is built once
+_ALL_COLORS_KEYBOARD = _build_color_picker_keyboard(tuple(STANDARD_YARN_PALETTE), False)
+
+
+def get_color_picker_keyboard(available_colors, show_all=False):
+    """
+    Keyboard for color selection.
+    
+    Args:
+        available_colors (list): List of color names
+        show_all (bool): If True, show all colors from palette
+    """
+    if show_all:
+        # Show all colors from standard palette
+        return _ALL_COLORS_KEYBOARD
+    
+    # Show only colors used in this pattern
+    return _build_color_picker_keyboard(tuple(available_colors), len(available_colors) < 10)
+
+
+_CONFIRM_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("نعم ✅", callback_data="confirm_yes"),
+        InlineKeyboardButton("لا ❌", callback_data="confirm_no"),
+    ]
+])
+
+
 def get_confirm_keyboard():
     """Simple yes/no confirmation"""
-    keyboard = [
-        [
-            InlineKeyboardButton("نعم ✅", callback_data="confirm_yes"),
-            InlineKeyboardButton("لا ❌", callback_data="confirm_no"),
-        ]
-    ]
-    
-    return InlineKeyboardMarkup(keyboard)
+    return _CONFIRM_KEYBOARD
 
 
 # Testing
@@ -5,24 +5,91 @@ This module provides a clean interface to the existing pattern generation logic.
 Keeps the core pattern algorithm separate from bot-specific code.
 """
 
+from functools import lru_cache
+import math
 import sys
 import os
-from PIL import Image
+from PIL import Image, ImageDraw
+import numpy as np
 
 # Import from parent directory
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from process import (
+    _pack_rgb,
+    load_font,
+    median3,
+    nearest_palette,
+    rgb_array_to_lab,
     suggest_colors_from_image,
-    map_to_user_palette,
     STANDARD_YARN_PALETTE,
-    CELL_SIZE
+    CELL_SIZE,
+    FONT_PATH
 )
+from core.arabic_cache import shape_many
+
+
+DEFAULT_COLOR_NAME = "أسود"  # Used for pixels that match no palette color
+
+
+def _build_name_table():
+    """
+    Sorted packed palette keys and the matching color names.
+    
+    Duplicate RGBs keep the last name, like a {rgb: name} dict. The names
+    array has one extra trailing entry - the default for misses.
+    """
+    rgb_to_name = {rgb: name for name, rgb in STANDARD_YARN_PALETTE.items()}
+    keys = _pack_rgb(np.array(list(rgb_to_name.keys()), dtype=np.uint8))
+    order = np.argsort(keys)
+    names = np.array(list(rgb_to_name.values()) + [DEFAULT_COLOR_NAME], dtype=object)
+    return keys[order], names[np.append(order, len(order))]
+
+
+_PALETTE_KEYS, _PALETTE_NAMES = _build_name_table()
+
+
+def _palette_name_index(keys):
+    """Index into _PALETTE_NAMES for each packed key; misses get len(_PALETTE_KEYS)"""
+    pos = np.minimum(np.searchsorted(_PALETTE_KEYS, keys), len(_PALETTE_KEYS) - 1)
+    return np.where(_PALETTE_KEYS[pos] == keys, pos, len(_PALETTE_KEYS))
+
+
+@lru_cache(maxsize=64)
+def _user_palette(user_colors):
+    """RGB (uint8) and Lab arrays for the known colors in user_colors (a tuple)"""
+    # dict keeps first-seen order and drops duplicates, like map_to_user_palette
+    palette = {name: STANDARD_YARN_PALETTE[name] for name in user_colors
+               if name in STANDARD_YARN_PALETTE}
+    rgb = np.array(list(palette.values()), dtype=np.uint8).reshape(-1, 3)
+    return rgb, rgb_array_to_lab(rgb)
+
+
+def _map_to_palette(img, user_colors):
+    """
+    Map every pixel to the closest user color in Lab space.
+    
+    Same result as process.map_to_user_palette, but the nearest-color search
+    runs once per distinct pixel color instead of once per pixel. Accepts a
+    PIL image or an (H, W, 3) uint8 array; always returns a PIL image.
+    """
+    arr = np.asarray(img, dtype=np.uint8)
+    palette_rgb, palette_lab = _user_palette(tuple(user_colors))
+    if len(palette_rgb) == 0:
+        return Image.fromarray(arr)
+    
+    keys, inverse = np.unique(_pack_rgb(arr).ravel(), return_inverse=True)
+    
+    # Unpack the distinct colors and find each one's nearest palette entry
+    unique_rgb = np.stack([keys >> 16, (keys >> 8) & 0xFF, keys & 0xFF], axis=1)
+    nearest = nearest_palette(rgb_array_to_lab(unique_rgb), palette_lab)
+    
+    return Image.fromarray(palette_rgb[nearest[inverse.reshape(-1)]].reshape(arr.shape))
 
 
 class PatternGenerator:
     """Manages pattern generation workflow"""
     
-    def __init__(self, image_path, size, is_knitting=False):
+    def __init__(self, image_path, size, is_knitting=False, image=None):
         """
         Initialize pattern generator.
         
@@ -30,16 +97,34 @@ class PatternGenerator:
             image_path (str): Path to the input image
             size (int): Longest side in stitches
             is_knitting (bool): Always False for crochet
+            image (PIL.Image): Optional already-decoded RGB image of
+                image_path - analysis and generation then reuse it instead
+                of decoding the file each
         """
         self.image_path = image_path
         self.size = size
         self.is_knitting = is_knitting
+        self.image = image
         
         self.suggested_colors = []
         self.pattern_grid = None
+        self.pattern_names = None  # Color name for each pattern_grid index
         self.pattern_image = None
         self.palette_image = None
+        self._pixel_keys = None  # Packed RGB per stitch, shared by palette + grid
         self.actual_size = None  # (width, height) in stitches
+    
+    @classmethod
+    def from_image(cls, image, size, is_knitting=False):
+        """
+        Create a generator for an image that is already open.
+        
+        The image is converted to RGB once here; analyze_colors() and
+        generate_pattern() both work from that copy. Call image.draft()
+        before passing a JPEG in to decode it at a reduced scale.
+        """
+        return cls(getattr(image, 'filename', None), size, is_knitting,
+                   image=image.convert("RGB"))
         
     def analyze_colors(self, max_colors=10):
         """
@@ -53,7 +138,8 @@ class PatternGenerator:
         """
         self.suggested_colors = suggest_colors_from_image(
             self.image_path,
-            max_suggested=max_colors
+            max_suggested=max_colors,
+            image=self.image
         )
         return self.suggested_colors
     
@@ -71,7 +157,9 @@ class PatternGenerator:
                 'palette_image': PIL.Image,
                 'size': (width, height),
                 'colors': list of color names,
-                'total_stitches': int
+                'total_stitches': int,
+                'pattern_data': (H, W) int16 grid of pattern_names indices,
+                'pattern_names': list of color names
             }
         """
         if user_colors is None:
@@ -80,8 +168,14 @@ class PatternGenerator:
         if not user_colors:
             raise ValueError("No colors specified. Run analyze_colors() first or provide user_colors.")
         
-        # Load and resize image
-        img = Image.open(self.image_path).convert("RGB")
+        # Load and resize image. draft() lets JPEGs decode at a reduced scale
+        # that is still at least self.size on each side; a no-op for other formats
+        if self.image is not None:
+            img = self.image
+        else:
+            img = Image.open(self.image_path)
+            img.draft("RGB", (self.size, self.size))
+            img = img.convert("RGB")
         
         # Calculate dimensions maintaining aspect ratio
         width, height = img.size
@@ -100,15 +194,16 @@ class PatternGenerator:
         if new_height < MIN_DIMENSION:
             new_height = MIN_DIMENSION
         
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # Bilinear is enough here - the median filter below smooths the result
+        img = img.resize((new_width, new_height), Image.Resampling.BILINEAR)
         self.actual_size = (new_width, new_height)
         
         # Apply median filter for smoothing
-        from PIL import ImageFilter
-        img = img.filter(ImageFilter.MedianFilter(size=3))
+        arr = median3(img)
         
         # Map to user's color palette
-        self.pattern_image = map_to_user_palette(img, user_colors)
+        self.pattern_image = _map_to_palette(arr, user_colors)
+        self._pixel_keys = _pack_rgb(np.asarray(self.pattern_image))
         
         # Create grid visualization
         self.grid_image = self._create_grid_pattern(user_colors)
@@ -118,6 +213,7 @@ class PatternGenerator:
         
         # Extract pattern data as 2D array
         self.pattern_grid = self._extract_pattern_data()
+        self.pattern_names = _PALETTE_NAMES.tolist()
         
         total_stitches = new_width * new_height
         
@@ -128,13 +224,12 @@ class PatternGenerator:
             'size': self.actual_size,
             'colors': user_colors,
             'total_stitches': total_stitches,
-            'pattern_data': self.pattern_grid
+            'pattern_data': self.pattern_grid,
+            'pattern_names': self.pattern_names
         }
     
     def _create_grid_pattern(self, colors):
         """Create grid visualization"""
-        from PIL import ImageDraw
-        
         width, height = self.pattern_image.size
         grid_width = width * CELL_SIZE
         grid_height = height * CELL_SIZE
@@ -151,41 +246,43 @@ class PatternGenerator:
             grid_width = int(grid_width * scale_factor)
             grid_height = int(grid_height * scale_factor)
         
-        grid_image = self.pattern_image.resize((grid_width, grid_height), Image.Resampling.NEAREST)
-        draw = ImageDraw.Draw(grid_image)
+        if (grid_width, grid_height) == (width * CELL_SIZE, height * CELL_SIZE):
+            # Integer upscale: expand each stitch into a CELL_SIZE block directly
+            arr = np.asarray(self.pattern_image)
+            arr = arr.repeat(CELL_SIZE, axis=0).repeat(CELL_SIZE, axis=1)
+        else:
+            # Padded to the minimum or capped for Telegram - not a whole multiple
+            arr = np.array(self.pattern_image.resize((grid_width, grid_height), Image.Resampling.NEAREST))
         
-        # Draw grid lines
+        # Draw grid lines - every 1px line at once as two strided writes
         grid_color = (200, 200, 200)
-        for x in range(0, grid_width, CELL_SIZE):
-            draw.line([(x, 0), (x, grid_height)], fill=grid_color, width=1)
-        for y in range(0, grid_height, CELL_SIZE):
-            draw.line([(0, y), (grid_width, y)], fill=grid_color, width=1)
+        arr[:, ::CELL_SIZE] = grid_color
+        arr[::CELL_SIZE, :] = grid_color
+        grid_image = Image.fromarray(arr)
         
         # Draw border
+        draw = ImageDraw.Draw(grid_image)
         draw.rectangle([(0, 0), (grid_width - 1, grid_height - 1)], outline="black", width=3)
         
         return grid_image
     
     def _create_color_palette_image(self, colors):
         """Create color palette visualization"""
-        from PIL import ImageDraw, ImageFont
-        import math
-        
-        width, height = self.pattern_image.size
-        
-        # Get color counts
-        color_counts = self.pattern_image.getcolors(width * height)
-        if not color_counts:
+        # Get color counts, most used first
+        keys, counts = np.unique(self._pixel_keys, return_counts=True)
+        if len(keys) == 0:
             # Return minimum size palette (Telegram requirement)
             return Image.new('RGB', (300, 80), 'white')
         
-        color_counts.sort(key=lambda x: x[0], reverse=True)
+        order = np.argsort(-counts, kind='stable')
+        keys, counts = keys[order], counts[order]
         
         # Create color map
-        rgb_to_name = {rgb: name for name, rgb in STANDARD_YARN_PALETTE.items()}
+        idx = _palette_name_index(keys)
         color_data = []
-        for count, rgb in color_counts:
-            color_name = rgb_to_name.get(rgb, f"RGB{rgb}")
+        for key, i, count in zip(keys.tolist(), idx.tolist(), counts.tolist()):
+            rgb = (key >> 16, (key >> 8) & 0xFF, key & 0xFF)
+            color_name = _PALETTE_NAMES[i] if i < len(_PALETTE_KEYS) else f"RGB{rgb}"
             color_data.append((rgb, color_name, count))
         
         # Layout
@@ -206,18 +303,12 @@ class PatternGenerator:
         
         palette_image = Image.new("RGB", (img_width, img_height), "white")
         draw = ImageDraw.Draw(palette_image)
+        font = load_font(FONT_PATH, 20)
         
+        # Shape every label in one batch
+        labels = shape_many(f"{name}\nعدد الغرز: {count}" for _, name, count in color_data)
         
-        try:
-            from process import FONT_PATH
-            if FONT_PATH and os.path.exists(FONT_PATH):
-                font = ImageFont.truetype(FONT_PATH, 20)
-            else:
-                font = ImageFont.load_default()
-        except Exception as e:
-            font = ImageFont.load_default()
-        
-        for i, (rgb, name, count) in enumerate(color_data):
+        for i, ((rgb, name, count), label_arabic) in enumerate(zip(color_data, labels)):
             row = i // palette_cols
             col = i % palette_cols
             x_base = col * cell_width
@@ -232,9 +323,6 @@ class PatternGenerator:
             )
             
             # Draw label
-            label = f"{name}\nعدد الغرز: {count}"
-            from process import text_arabic
-            label_arabic = text_arabic(label)
             draw.text((x_base + 60, y_base + 20), label_arabic, fill="black", font=font)
         
         return palette_image
@@ -244,44 +332,31 @@ class PatternGenerator:
         Extract 2D array of color names from pattern image.
         
         Returns:
-            list of lists: pattern_grid[row][col] = color_name
+            np.ndarray: (H, W) int16 grid indexing self.pattern_names
         """
         if self.pattern_image is None:
             return None
         
-        width, height = self.pattern_image.size
-        pixels = self.pattern_image.load()
-        
-        # Build reverse lookup: RGB -> color name
-        rgb_to_name = {}
-        for name, rgb in STANDARD_YARN_PALETTE.items():
-            rgb_to_name[rgb] = name
-        
-        # Extract grid
-        grid = []
-        for y in range(height):
-            row = []
-            for x in range(width):
-                pixel_rgb = pixels[x, y]
-                color_name = rgb_to_name.get(pixel_rgb, "أسود")  # Default to black
-                row.append(color_name)
-            grid.append(row)
-        
-        return grid
+        # Misses point at the trailing default name (black)
+        return _palette_name_index(self._pixel_keys).astype(np.int16)
     
-    def save_outputs(self, grid_path, palette_path):
+    def save_outputs(self, grid_path, palette_path, **save_options):
         """
         Save generated images to files.
         
         Args:
             grid_path (str): Path to save grid pattern
             palette_path (str): Path to save color palette
+            **save_options: Passed to Image.save (e.g. compress_level=1
+                for throwaway debug output)
         """
         if self.grid_image is None or self.palette_image is None:
             raise ValueError("No pattern generated yet. Run generate_pattern() first.")
         
-        self.grid_image.save(grid_path)
-        self.palette_image.save(palette_path)
+        # Kept serial: the palette is ~5% of the save time, and overlapping it
+        # with the grid encode on a second thread measured no faster
+        self.grid_image.save(grid_path, **save_options)
+        self.palette_image.save(palette_path, **save_options)
         
         return grid_path, palette_path
 
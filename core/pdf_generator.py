@@ -10,14 +10,16 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os
-import arabic_reshaper
-from bidi.algorithm import get_display
+
+from core.arabic_cache import shape_arabic
+
 
 class PDFGenerator:
     """Generates PDF with crochet instructions"""
     
     def __init__(self):
         self._register_fonts()
+        self._build_styles()
         
     def _register_fonts(self):
         """Register Arabic-supporting fonts"""
@@ -35,37 +37,15 @@ class PDFGenerator:
             print(f"Font registration error: {e}")
             self.font_name = 'Helvetica'
 
-    def _process_text(self, text):
-        """Reshape Arabic text for proper display"""
-        if not text:
-            return ""
-        reshaped_text = arabic_reshaper.reshape(text)
-        bidi_text = get_display(reshaped_text)
-        return bidi_text
-
-    def generate_steps_pdf(self, steps, basic_info, output_path):
-        """
-        Generate PDF with steps
-        
-        Args:
-            steps (list): List of step dictionaries
-            basic_info (dict): Project info (size, colors, etc)
-            output_path (str): Path to save PDF
-        """
-        doc = SimpleDocTemplate(
-            output_path,
-            pagesize=A4,
-            rightMargin=50, leftMargin=50,
-            topMargin=50, bottomMargin=50
-        )
-        
+    def _build_styles(self):
+        """Create the paragraph styles once per generator instead of per PDF / row"""
         styles = getSampleStyleSheet()
         
         # Create custom style for Arabic text
         # alignment=2 means CENTER, 1=LEFT, 0=LEFT?? No, 0=Left, 1=Center, 2=Right
         # For Arabic we want Right alignment usually, but Center for headers
         
-        title_style = ParagraphStyle(
+        self.title_style = ParagraphStyle(
             'ArabicTitle',
             parent=styles['Heading1'],
             fontName=self.font_name,
@@ -74,7 +54,7 @@ class PDFGenerator:
             spaceAfter=30
         )
         
-        normal_style = ParagraphStyle(
+        self.normal_style = ParagraphStyle(
             'ArabicNormal',
             parent=styles['Normal'],
             fontName=self.font_name,
@@ -83,19 +63,53 @@ class PDFGenerator:
             leading=20
         )
         
-        elements = []
+        self.row_header_style = ParagraphStyle(
+            'RowHeader',
+            parent=self.normal_style,
+            alignment=1, # Center
+            fontSize=12,
+            textColor=colors.gray
+        )
+
+    def _process_text(self, text):
+        """Reshape Arabic text for proper display"""
+        if not text:
+            return ""
+        return shape_arabic(text)[1]
+
+    def generate_steps_pdf(self, steps, basic_info, output_path):
+        """
+        Generate PDF with steps
+        
+        Args:
+            steps (iterable): Step dictionaries in order
+            basic_info (dict): Project info (size, colors, etc)
+            output_path (str): Path to save PDF
+        """
+        doc = SimpleDocTemplate(
+            output_path,
+            pagesize=A4,
+            rightMargin=50, leftMargin=50,
+            topMargin=50, bottomMargin=50
+        )
         
+        # Build PDF - ReportLab consumes the story as a list
+        doc.build(list(self._flowables(steps, basic_info)))
+        return output_path
+
+    def _flowables(self, steps, basic_info):
+        """Yield the PDF story one flowable at a time; steps may be any iterable"""
         # Title
         title_text = self._process_text("مخطط الكروشيه")
-        elements.append(Paragraph(title_text, title_style))
+        yield Paragraph(title_text, self.title_style)
         
         # Basic Info
         info_text_1 = f"الحجم: {basic_info.get('width')}x{basic_info.get('height')} غرزة"
         info_text_2 = f"عدد الألوان: {basic_info.get('color_count')}"
         
-        elements.append(Paragraph(self._process_text(info_text_1), normal_style))
-        elements.append(Paragraph(self._process_text(info_text_2), normal_style))
-        elements.append(Spacer(1, 20))
+        yield Paragraph(self._process_text(info_text_1), self.normal_style)
+        yield Paragraph(self._process_text(info_text_2), self.normal_style)
+        yield Spacer(1, 20)
         
         # Steps
         current_row = 0
@@ -104,15 +118,9 @@ class PDFGenerator:
             # Add row header if new row
             if step['row'] != current_row:
                 current_row = step['row']
-                elements.append(Spacer(1, 10))
+                yield Spacer(1, 10)
                 row_text = self._process_text(f"--- السطر {current_row} ---")
-                elements.append(Paragraph(row_text, ParagraphStyle(
-                    'RowHeader',
-                    parent=normal_style,
-                    alignment=1, # Center
-                    fontSize=12,
-                    textColor=colors.gray
-                )))
+                yield Paragraph(row_text, self.row_header_style)
             
             # Step instruction
             # instruction_ar from step generator is like "اشتغلي 5 غرز من اللون أحمر الى اليمين"
@@ -120,9 +128,5 @@ class PDFGenerator:
             # Prepend step number ? e.g. "1. instruction"
             full_text = f"{step['step_number']}. {instruction}"
             
-            elements.append(Paragraph(self._process_text(full_text), normal_style))
-            
-        # Build PDF
-        doc.build(elements)
-        return output_path
+            yield Paragraph(self._process_text(full_text), self.normal_style)
 
@@ -8,11 +8,20 @@ Uses SQLite for persistence.
 import sqlite3
 import json
 import os
-from datetime import datetime
+import threading
+import time
+from functools import lru_cache
 
 class SessionManager:
     """Manages user sessions and pattern state"""
     
+    # Columns _get_column may interpolate into SQL
+    _SESSION_COLUMNS = frozenset({
+        'session_id', 'user_id', 'image_path', 'original_image_path',
+        'pattern_size', 'colors_json', 'grid_path', 'palette_path',
+        'current_step', 'total_steps', 'color_edits_json', 'created_at',
+    })
+    
     def __init__(self, db_path="data/sessions.db"):
         """
         Initialize session manager.
@@ -22,6 +31,18 @@ class SessionManager:
         """
         self.db_path = db_path
         self._ensure_database()
+        
+        # One long-lived autocommit connection instead of connect/close per call
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        self._lock = threading.Lock()
+        
+        # UPDATE statement text per set of columns, so SQLite's statement
+        # cache sees the same SQL each time
+        self._update_sql_cache = {}
     
     def _ensure_database(self):
         """Create database and tables if they don't exist"""
@@ -39,7 +60,7 @@ class SessionManager:
                 first_name TEXT,
                 language_code TEXT DEFAULT 'ar',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- Unix epoch seconds once set
             )
         ''')
         
@@ -62,21 +83,22 @@ class SessionManager:
             )
         ''')
         
+        # Latest-session lookups: seek on user_id, already ordered by created_at
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_created
+            ON sessions (user_id, created_at DESC)
+        ''')
+        
         conn.commit()
         conn.close()
     
     def register_user(self, user_id, username=None, first_name=None, language_code='ar'):
         """Register or update user info"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, username, first_name, language_code, last_active)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, username, first_name, language_code, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO users (user_id, username, first_name, language_code, last_active)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, username, first_name, language_code, int(time.time())))
     
     def create_session(self, user_id, image_path, original_image_path):
         """
@@ -85,18 +107,13 @@ class SessionManager:
         Returns:
             str: Session ID
         """
-        session_id = f"{user_id}_{int(datetime.now().timestamp())}"
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO sessions (session_id, user_id, image_path, original_image_path)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, user_id, image_path, original_image_path))
+        session_id = f"{user_id}_{int(time.time())}"
         
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO sessions (session_id, user_id, image_path, original_image_path)
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, user_id, image_path, original_image_path))
         
         return session_id
     
@@ -108,34 +125,24 @@ class SessionManager:
             pattern_size, colors_json, grid_path, palette_path,
             current_step, total_steps, color_edits_json
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Build update query dynamically
-        updates = []
-        values = []
-        for key, value in kwargs.items():
-            updates.append(f"{key} = ?")
-            values.append(value)
-        
-        values.append(session_id)
-        
-        query = f"UPDATE sessions SET {', '.join(updates)} WHERE session_id = ?"
-        cursor.execute(query, values)
-        
-        conn.commit()
-        conn.close()
+        columns = sorted(kwargs)
+        key = frozenset(columns)
+        query = self._update_sql_cache.get(key)
+        if query is None:
+            updates = ', '.join(f"{column} = ?" for column in columns)
+            query = f"UPDATE sessions SET {updates} WHERE session_id = ?"
+            self._update_sql_cache[key] = query
+        
+        values = tuple(kwargs[column] for column in columns) + (session_id,)
+        with self._lock:
+            self._conn.execute(query, values)
     
     def get_session(self, session_id):
         """Get session data"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,))
-        row = cursor.fetchone()
-        
-        conn.close()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
         
         if row:
             return dict(row)
@@ -143,24 +150,33 @@ class SessionManager:
     
     def get_user_latest_session(self, user_id):
         """Get user's most recent session"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM sessions 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        ''', (user_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._lock:
+            row = self._conn.execute('''
+                SELECT * FROM sessions 
+                WHERE user_id = ? 
+                ORDER BY created_at DESC 
+                LIMIT 1
+            ''', (user_id,)).fetchone()
         
         if row:
             return dict(row)
         return None
     
+    def _get_column(self, session_id, column):
+        """
+        Read one column of a session without fetching the whole row.
+        
+        Returns:
+            tuple or None: (value,) if the session exists, else None
+        """
+        if column not in self._SESSION_COLUMNS:
+            raise ValueError(f"Unknown session column: {column}")
+        
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT {column} FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+    
     def save_color_edits(self, session_id, color_edits):
         """
         Save color edits for session.
@@ -174,9 +190,9 @@ class SessionManager:
     
     def get_color_edits(self, session_id):
         """Get color edits for session"""
-        session = self.get_session(session_id)
-        if session and session.get('color_edits_json'):
-            return json.loads(session['color_edits_json'])
+        row = self._get_column(session_id, 'color_edits_json')
+        if row and row[0]:
+            return json.loads(row[0])
         return {}
     
     def set_current_step(self, session_id, step_number):
@@ -185,8 +201,14 @@ class SessionManager:
     
     def get_current_step(self, session_id):
         """Get current step number"""
-        session = self.get_session(session_id)
-        return session.get('current_step', 1) if session else 1
+        row = self._get_column(session_id, 'current_step')
+        return row[0] if row else 1
+
+
+@lru_cache(maxsize=None)
+def get_session_manager(db_path="data/sessions.db"):
+    """Shared SessionManager (and so one SQLite connection) per database path"""
+    return SessionManager(db_path)
 
 
 # Testing
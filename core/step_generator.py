@@ -5,24 +5,98 @@ This is the heart of the step-by-step mode. It analyzes the pattern grid
 and breaks it down into actionable instructions: "X stitches of color Y".
 """
 
+import numpy as np
+
 from process import STANDARD_YARN_PALETTE
 
 
+def _index_grid(pattern_grid):
+    """
+    Convert a grid of color names to an int16 index grid.
+    
+    Returns:
+        tuple: ((H, W) int16 array, list of names the indices point into)
+    """
+    if len(pattern_grid) == 0:
+        return np.zeros((0, 0), dtype=np.int16), []
+    
+    names, inverse = np.unique(np.asarray(pattern_grid), return_inverse=True)
+    return inverse.reshape(len(pattern_grid), -1).astype(np.int16), names.tolist()
+
+
+def _row_runs(grid, grid_names):
+    """
+    Run-length encode every row of an index grid in one NumPy pass.
+    
+    Crochet alternates direction: even rows go right, odd rows go left and
+    are read reversed, so start_col counts from the row's working end.
+    
+    Returns:
+        tuple: (rows, start_cols, counts, color_names, directions) lists,
+               one entry per run in step order
+    """
+    if grid.size == 0:
+        return [], [], [], [], []
+    
+    height, width = grid.shape
+    grid = grid.copy()
+    grid[1::2] = grid[1::2, ::-1]
+    
+    # A run starts at column 0 and wherever the color changes
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = grid[:, 1:] != grid[:, :-1]
+    rows, start_cols = np.nonzero(starts)
+    
+    # Every row opens a run, so runs end at the next start in row-major order
+    flat_starts = rows * width + start_cols
+    counts = np.diff(np.append(flat_starts, height * width))
+    
+    colors = [grid_names[i] for i in grid[rows, start_cols].tolist()]
+    directions = np.where(rows % 2 == 0, 'right', 'left').tolist()
+    return rows.tolist(), start_cols.tolist(), counts.tolist(), colors, directions
+
+
+def count_steps(pattern_grid):
+    """
+    Number of steps StepGenerator would produce, without building them.
+    
+    Args:
+        pattern_grid: 2D int index array or list of lists of color names
+    """
+    grid = np.asarray(pattern_grid)
+    if grid.size == 0:
+        return 0
+    
+    # One run per row plus one per color change; reversing a row keeps its count
+    return grid.shape[0] + int(np.count_nonzero(grid[:, 1:] != grid[:, :-1]))
+
+
 class StepGenerator:
     """Generates row-by-step crochet instructions from pattern grid"""
     
-    def __init__(self, pattern_grid, color_names):
+    # Instruction templates: (count, color_name)
+    _TPL_RIGHT = "اشتغلي %d غرز من اللون %s الى اليمين"
+    _TPL_LEFT = "اشتغلي %d غرز من اللون %s الى اليسار"
+    _TPL_NEW_ROW_PREFIX = "سطر جديد : "
+    
+    def __init__(self, pattern_grid, color_names, grid_names=None):
         """
         Initialize step generator.
         
         Args:
-            pattern_grid (list of lists): 2D array pattern_grid[row][col] = color_name
+            pattern_grid: 2D int array indexing grid_names (edited in place),
+                          or list of lists pattern_grid[row][col] = color_name
             color_names (list): List of color names used in pattern
+            grid_names (list): Names for an int pattern_grid's values
+                               (extended in place if an edit adds a color)
         """
+        if grid_names is None:
+            pattern_grid, grid_names = _index_grid(pattern_grid)
+        
         self.pattern_grid = pattern_grid
+        self.grid_names = grid_names
         self.color_names = color_names
-        self.height = len(pattern_grid)
-        self.width = len(pattern_grid[0]) if pattern_grid else 0
+        self.height, self.width = pattern_grid.shape
         
         self.steps = []
         self._generate_steps()
@@ -32,60 +106,31 @@ class StepGenerator:
         Convert pattern grid into step-by-step instructions.
         Groups consecutive cells of same color into single steps.
         """
-        step_num = 1
+        rows, start_cols, counts, colors, directions = _row_runs(self.pattern_grid, self.grid_names)
         
-        for row_idx, row in enumerate(self.pattern_grid):
-            # Crochet alternates direction: odd rows go right, even rows go left
-            # For simplicity in MVP, we'll always go right (user can reverse mentally)
-            direction = 'right' if row_idx % 2 == 0 else 'left'
-            
-            # If going left, reverse the row for processing
-            if direction == 'left':
-                row = list(reversed(row))
-            
-            # Group consecutive same-color cells
-            current_color = row[0]
-            start_col = 0
-            count = 1
-            
-            for col_idx in range(1, len(row)):
-                if row[col_idx] == current_color:
-                    count += 1
-                else:
-                    # Save current group as a step
-                    self.steps.append(self._create_step(
-                        step_num, row_idx, start_col, count, 
-                        current_color, direction
-                    ))
-                    
-                    # Start new group
-                    current_color = row[col_idx]
-                    start_col = col_idx
-                    count = 1
-                    step_num += 1
-            
-            # Don't forget last group in row
-            self.steps.append(self._create_step(
-                step_num, row_idx, start_col, count, 
-                current_color, direction
-            ))
-            step_num += 1
+        self.steps = [
+            self._create_step(step_num, row_idx, start_col, count, color_name, direction)
+            for step_num, (row_idx, start_col, count, color_name, direction)
+            in enumerate(zip(rows, start_cols, counts, colors, directions), start=1)
+        ]
+        
+        # Row number (1-indexed) -> that row's steps, in order
+        self._by_row = {}
+        for step in self.steps:
+            self._by_row.setdefault(step['row'], []).append(step)
     
     def _create_step(self, step_num, row_idx, start_col, count, color_name, direction):
         """Create a step dictionary"""
         # Get RGB for color
         color_rgb = STANDARD_YARN_PALETTE.get(color_name, (0, 0, 0))
         
-        # Direction text
-        arrow = 'الى اليمين' if direction == 'right' else 'الى اليسار'
-        
         # Build instruction in Arabic
-        # Add new row notification if this is the first stitch of a non-first row
-        instruction = f"اشتغلي {count} غرز من اللون {color_name} {arrow}"
+        template = self._TPL_RIGHT if direction == 'right' else self._TPL_LEFT
+        instruction = template % (count, color_name)
         
         # If this is the start of a new row (start_col == 0), add new row notification
         if start_col == 0 and row_idx > 0:
-            instruction = f"سطر جديد : {instruction}"
+            instruction = self._TPL_NEW_ROW_PREFIX + instruction
         
         return {
             'step_number': step_num,
@@ -113,6 +158,15 @@ class StepGenerator:
             return self.steps[step_number - 1]
         return None
     
+    def get_all_steps(self):
+        """
+        Get every step in order.
+        
+        Returns:
+            list: Step dictionaries (a new list; the dicts are shared)
+        """
+        return list(self.steps)
+    
     def get_total_steps(self):
         """Get total number of steps"""
         return len(self.steps)
@@ -127,7 +181,7 @@ class StepGenerator:
         Returns:
             list: List of step dictionaries for that row
         """
-        return [s for s in self.steps if s['row'] == row_number]
+        return list(self._by_row.get(row_number, ()))
     
     def apply_color_edit(self, step_number, new_color_name):
         """
@@ -150,22 +204,23 @@ class StepGenerator:
         start_col = step['start_col']
         end_col = step['end_col']
         
-        for col in range(start_col, end_col):
-            self.pattern_grid[row_idx][col] = new_color_name
+        if new_color_name not in self.grid_names:
+            self.grid_names.append(new_color_name)
+        self.pattern_grid[row_idx, start_col:end_col] = self.grid_names.index(new_color_name)
         
         # Update step data
         step['color_name'] = new_color_name
         step['color_rgb'] = STANDARD_YARN_PALETTE.get(new_color_name, (0, 0, 0))
         
         # Update instruction
-        arrow = 'الى اليمين' if step['direction'] == 'right' else 'الى اليسار'
-        step['instruction_ar'] = f"اشتغلي {step['count']} غرز من اللون {new_color_name} {arrow}"
+        template = self._TPL_RIGHT if step['direction'] == 'right' else self._TPL_LEFT
+        step['instruction_ar'] = template % (step['count'], new_color_name)
         
         return step
     
     def get_pattern_grid(self):
-        """Get current pattern grid (with any applied edits)"""
-        return self.pattern_grid
+        """Get current pattern grid (with any applied edits) as lists of color names"""
+        return np.array(self.grid_names, dtype=object)[self.pattern_grid].tolist()
 
 
 # Testing
@@ -6,43 +6,60 @@ Handles image upload, analysis, and initiates pattern generation workflow.
 
 from telegram import Update
 from telegram.ext import ContextTypes
+import asyncio
+import hashlib
 import os
 import config
 from core.image_analyzer import analyze_image_complexity
-from core.session import SessionManager
+from core.session import get_session_manager
 from core.keyboards import get_size_selection_keyboard
 
-session_mgr = SessionManager(config.DATABASE_PATH)
+session_mgr = get_session_manager(config.DATABASE_PATH)
+
+
+def _write_file(path, data):
+    """Write bytes to path atomically, so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
 
 
 async def image_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle image uploads"""
     user_id = update.effective_user.id
     
-    # Ensure temp directory exists
-    os.makedirs(config.TEMP_DIR, exist_ok=True)
-    
     # Download image
     photo = update.message.photo[-1]  # Get largest size
     
-    await update.message.reply_text("🔍 يتم تحليل الصورة...")
+    # Status message goes out while the photo downloads
+    status_task = asyncio.create_task(update.message.reply_text("🔍 يتم تحليل الصورة..."))
     
-    # Download to temp
+    # Download into memory - analysis reads the bytes directly
     file = await context.bot.get_file(photo.file_id)
-    image_path = os.path.join(config.TEMP_DIR, f"{user_id}_{photo.file_id}.jpg")
-    await file.download_to_drive(image_path)
-    
-    # Save original for later
-    original_path = image_path
+    image_data = bytes(await file.download_as_bytearray())
     
     # Analyze image complexity
     try:
-        analysis = analyze_image_complexity(image_path)
+        analysis = await asyncio.to_thread(analyze_image_complexity, image_data)
     except Exception as e:
         config.logger.error(f"Analysis error: {e}")
+        await status_task
         await update.message.reply_text(config.ERROR_MESSAGES['generic_error'])
         return
     
+    # Usable image - now persist it for pattern generation (off the event loop).
+    # Named by content, so re-sent photos reuse the file already on disk
+    digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+    image_path = os.path.join(config.TEMP_DIR, f"{digest}.jpg")
+    if os.path.exists(image_path):
+        os.utime(image_path)  # Fresh use - keep it from the temp cleanup sweep
+    else:
+        await asyncio.to_thread(_write_file, image_path, image_data)
+    
+    # Save original for later
+    original_path = image_path
+    
     # Create session
     session_id = session_mgr.create_session(user_id, image_path, original_path)
     
@@ -72,6 +89,8 @@ async def image_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         analysis['max_size']
     )
     
+    # Keep the status message ahead of the result
+    await status_task
     await update.message.reply_text(
         message,
         reply_markup=keyboard,
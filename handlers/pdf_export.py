@@ -5,13 +5,20 @@ PDF Export Handler - Generates and sends pattern PDF
 
 from telegram import Update
 from telegram.ext import ContextTypes
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
+from pathlib import Path
 import config
-from core.session import SessionManager
+from core.session import get_session_manager
 from core.step_generator import StepGenerator
 from core.pdf_generator import PDFGenerator
 
-session_mgr = SessionManager(config.DATABASE_PATH)
+session_mgr = get_session_manager(config.DATABASE_PATH)
+
+# PDF builds run here instead of on the event loop. ReportLab holds the GIL,
+# so one thread is enough; extra exports simply queue
+_PDF_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf')
 
 async def export_pdf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle PDF export callback"""
@@ -34,10 +41,8 @@ async def export_pdf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Generate steps
         pattern_grid = pattern_result['pattern_data']
         colors = pattern_result['colors']
-        step_gen = StepGenerator(pattern_grid, colors)
-        steps = []
-        for i in range(1, step_gen.get_total_steps() + 1):
-            steps.append(step_gen.get_step(i))
+        step_gen = StepGenerator(pattern_grid, colors, grid_names=pattern_result['pattern_names'])
+        steps = step_gen.get_all_steps()
             
         # Basic Info
         basic_info = {
@@ -50,18 +55,17 @@ async def export_pdf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         pdf_gen = PDFGenerator()
         output_path = os.path.join(config.TEMP_DIR, f"{session_id}_pattern.pdf")
         
-        # Ensure temp dir exists
-        os.makedirs(config.TEMP_DIR, exist_ok=True)
-        
-        pdf_gen.generate_steps_pdf(steps, basic_info, output_path)
+        await asyncio.get_running_loop().run_in_executor(
+            _PDF_EXECUTOR, pdf_gen.generate_steps_pdf, steps, basic_info, output_path
+        )
         
-        # Send PDF
-        with open(output_path, 'rb') as pdf_file:
-            await query.message.reply_document(
-                document=pdf_file,
-                filename="pattern.pdf",
-                caption="📄 تفضلي هذا مخطط الكروشيه كامل"
-            )
+        # Send PDF - read off the event loop
+        pdf_data = await asyncio.to_thread(Path(output_path).read_bytes)
+        await query.message.reply_document(
+            document=pdf_data,
+            filename="pattern.pdf",
+            caption="📄 تفضلي هذا مخطط الكروشيه كامل"
+        )
             
     except Exception as e:
         config.logger.error(f"PDF generation error: {e}")
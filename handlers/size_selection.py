@@ -2,19 +2,63 @@
 Size Selection Handler - Handles size button callbacks and custom size input
 """
 
-from telegram import Update
+from telegram import InputMediaPhoto, Update
 from telegram.ext import ContextTypes, ConversationHandler
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
 import os
+from pathlib import Path
 import config
 from core.pattern_gen import PatternGenerator
-from core.session import SessionManager
+from core.composite_img import invalidate_prepared
+from core.step_generator import count_steps
+from core.session import get_session_manager
 from core.keyboards import get_main_menu_keyboard
 
-session_mgr = SessionManager(config.DATABASE_PATH)
+session_mgr = get_session_manager(config.DATABASE_PATH)
 
 # Conversation state
 WAITING_CUSTOM_SIZE = 1
 
+# Worker processes for pattern generation, created on first use
+_pattern_pool = None
+
+
+def _get_pattern_pool():
+    global _pattern_pool
+    if _pattern_pool is None:
+        # forkserver, not fork - the bot already runs worker threads, and a
+        # forked child would inherit whatever locks they hold. Windows has no
+        # forkserver; spawn starts clean processes there too
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            start_method = 'forkserver'
+        else:
+            start_method = 'spawn'
+        _pattern_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context(start_method)
+        )
+    return _pattern_pool
+
+
+def _discard_pattern_pool(pool):
+    """Drop a broken pool so the next request starts a fresh one"""
+    global _pattern_pool
+    if _pattern_pool is pool:
+        _pattern_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pattern_pool():
+    """Stop the pattern worker processes (called on application shutdown)"""
+    global _pattern_pool
+    if _pattern_pool is not None:
+        _pattern_pool.shutdown(wait=False, cancel_futures=True)
+        _pattern_pool = None
+
 
 async def size_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle size selection button callbacks"""
@@ -59,6 +103,33 @@ async def custom_size_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         return WAITING_CUSTOM_SIZE
 
 
+def _run_pattern_sync(image_path, size, grid_path, palette_path):
+    """
+    Analyze colors, generate the pattern and save its images.
+    
+    Runs in a worker process. Only the colors and a lightweight result come
+    back - the grid and palette images are saved to grid_path and
+    palette_path, and shipping them (or the generator) back would only add
+    pickling time.
+    
+    Returns:
+        tuple: (colors, result)
+    """
+    generator = PatternGenerator(image_path, size, is_knitting=False)
+    
+    # Analyze colors
+    colors = generator.analyze_colors(max_colors=config.MAX_COLORS)
+    
+    # Generate pattern
+    result = generator.generate_pattern(user_colors=colors)
+    
+    # Save outputs
+    generator.save_outputs(grid_path, palette_path)
+    
+    result = {k: v for k, v in result.items() if k not in ('grid_image', 'palette_image')}
+    return colors, result
+
+
 async def _generate_pattern(update, context, size):
     """Generate the pattern with specified size"""
     # Get session
@@ -75,55 +146,60 @@ async def _generate_pattern(update, context, size):
     image_path = session['image_path']
     original_path = session['original_image_path']
     
-    # Send processing message
-    processing_msg = await update.effective_message.reply_text("⏳ جاري إنشاء المـخطط...")
+    # Send processing message while the pattern is generated
+    status_task = asyncio.create_task(
+        update.effective_message.reply_text("⏳ جاري إنشاء المـخطط...")
+    )
     
     try:
-        # Generate pattern
-        generator = PatternGenerator(image_path, size, is_knitting=False)
-        
-        # Analyze colors
-        colors = generator.analyze_colors(max_colors=config. MAX_COLORS)
-        
-        # Generate pattern
-        result = generator.generate_pattern(user_colors=colors)
-        
-        # Save outputs
         grid_path = os.path.join(config.TEMP_DIR, f"{session_id}_grid.png")
         palette_path = os.path.join(config.TEMP_DIR, f"{session_id}_palette.png")
         
-        generator.save_outputs(grid_path, palette_path)
+        # CPU-bound - run in a worker process so other chats keep being served
+        pool = _get_pattern_pool()
+        try:
+            colors, result = await asyncio.get_running_loop().run_in_executor(
+                pool, _run_pattern_sync, image_path, size, grid_path, palette_path
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed) - this request fails, later ones
+            # get a new pool instead of the same error until restart
+            _discard_pattern_pool(pool)
+            raise
+        processing_msg = await status_task
         
         # Update session
         session_mgr.update_session(
             session_id,
             pattern_size=size,
-            colors_json=str(colors),
+            colors_json=json.dumps(colors, ensure_ascii=False, separators=(',', ':')),
             grid_path=grid_path,
-            palette_path=palette_path
+            palette_path=palette_path,
+            total_steps=count_steps(result['pattern_data']),
+            current_step=1
         )
         
+        # New pattern for this session - drop any prepared step-mode state
+        invalidate_prepared(session_id)
+        
         # Store in context for step mode
-        context.user_data['generator'] = generator
         context.user_data['pattern_result'] = result
         context.user_data['grid_path'] = grid_path
         context.user_data['palette_path'] = palette_path
         
-        # Delete processing message
-        await processing_msg.delete()
-        
-        # Send pattern images FIRST
-        with open(grid_path, 'rb') as grid_file:
-            await update.effective_message.reply_photo(
-                photo=grid_file,
-                caption="🎨 مخطط الكروشية"
-            )
-        
-        with open(palette_path, 'rb') as palette_file:
-            await update.effective_message.reply_photo(
-                photo=palette_file,
-                caption="🎨 لوحة الألوان"
-            )
+        # Delete processing message while sending the pattern images FIRST
+        # (one album, one API call) - the two requests don't depend on each other
+        grid_data, palette_data = await asyncio.gather(
+            asyncio.to_thread(Path(grid_path).read_bytes),
+            asyncio.to_thread(Path(palette_path).read_bytes),
+        )
+        await asyncio.gather(
+            processing_msg.delete(),
+            update.effective_message.reply_media_group(media=[
+                InputMediaPhoto(media=grid_data, caption="🎨 مخطط الكروشية"),
+                InputMediaPhoto(media=palette_data, caption="🎨 لوحة الألوان"),
+            ]),
+        )
         
         # THEN send success message with menu
         await update.effective_message.reply_text(
@@ -138,4 +214,10 @@ async def _generate_pattern(update, context, size):
         
     except Exception as e:
         config.logger.error(f"Pattern generation error: {e}")
-        await processing_msg.edit_text(config.ERROR_MESSAGES['generic_error'])
+        # Turn the status message into the error - unless it never got sent
+        # or was already deleted; then the error goes out as a new message
+        try:
+            processing_msg = await status_task
+            await processing_msg.edit_text(config.ERROR_MESSAGES['generic_error'])
+        except Exception:
+            await update.effective_message.reply_text(config.ERROR_MESSAGES['generic_error'])
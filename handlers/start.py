@@ -5,9 +5,9 @@ Start Handler - /start, /help, /new commands
 from telegram import Update
 from telegram.ext import ContextTypes
 import config
-from core.session import SessionManager
+from core.session import get_session_manager
 
-session_mgr = SessionManager(config.DATABASE_PATH)
+session_mgr = get_session_manager(config.DATABASE_PATH)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
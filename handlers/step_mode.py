@@ -5,20 +5,33 @@ This is the heart of the interactive crochet assistant.
 Provides row-by-row instructions with visual guides.
 """
 
-from telegram import Update
+import asyncio
+from collections import defaultdict
+import copy
+import io
+import os
+from pathlib import Path
+
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from PIL import Image
 import config
 from core.step_generator import StepGenerator
-from core.composite_img import CompositeImageCreator
-from core.session import SessionManager
+from core.composite_img import CompositeImageCreator, invalidate_prepared
+from core.session import get_session_manager
 from core.keyboards import (
     get_step_navigation_keyboard,
     get_color_picker_keyboard
 )
 
-session_mgr = SessionManager(config.DATABASE_PATH)
+session_mgr = get_session_manager(config.DATABASE_PATH)
+
+# Serializes a session's step changes end to end - read step, delete the old
+# message, render/send the new one, record its id - so rapid taps can't
+# interleave and orphan step messages. Per session, so chats never wait on
+# each other. One small lock per session; kept for the process lifetime, as
+# dropping a lock another handler still waits on would let two run at once
+_SESSION_LOCKS = defaultdict(asyncio.Lock)
 
 
 async def start_step_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -28,11 +41,10 @@ async def start_step_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get pattern data from context
     pattern_result = context.user_data.get('pattern_result')
-    generator = context.user_data.get('generator')
     grid_path = context.user_data.get('grid_path')
     session_id = context.user_data.get('session_id')
     
-    if not all([pattern_result, generator, grid_path, session_id]):
+    if not all([pattern_result, grid_path, session_id]):
         await query.edit_message_text(config.ERROR_MESSAGES['no_session'])
         return
     
@@ -44,25 +56,36 @@ async def start_step_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pattern_grid = pattern_result['pattern_data']
     colors = pattern_result['colors']
     
-    step_gen = StepGenerator(pattern_grid, colors)
+    step_gen = StepGenerator(pattern_grid, colors, grid_names=pattern_result['pattern_names'])
     total_steps = step_gen.get_total_steps()
     
-    # Update session
-    session_mgr.update_session(session_id, total_steps=total_steps, current_step=1)
+    # _generate_pattern already stored total_steps and step 1 - only
+    # re-entering step mode after moving on needs a write
+    if session['current_step'] != 1:
+        session_mgr.set_current_step(session_id, 1)
     
-    # Store images for composite creation
-    grid_image = Image.open(grid_path)    
+    # Store images for composite creation - decoded off the event loop
+    try:
+        grid_image, original_image = await _load_images(grid_path, original_path)
+    except FileNotFoundError:
+        # Swept from TEMP_DIR after a long idle - the user has to start over
+        await query.edit_message_text(config.ERROR_MESSAGES['no_session'])
+        return
     # Reload grid and create new composite creator with updated pattern
     pattern_image = pattern_result.get('pattern_image')  # Get pattern image from result
     
     context.user_data['composite_creator'] = CompositeImageCreator(
         grid_image,
-        Image.open(original_path),
-        pattern_grid,
-        pattern_image=pattern_image  # Pass pattern image!
+        original_image,
+        step_gen.get_pattern_grid(),
+        pattern_image=pattern_image,  # Pass pattern image!
+        pattern_id=session_id
     )
     context.user_data['step_generator'] = step_gen
     context.user_data['pattern_image'] = pattern_image  # Store for later use
+    context.user_data['original_path'] = original_path  # Reloaded on color edits
+    context.user_data['step_file_ids'] = {}  # New pattern - no uploaded composites yet
+    _cancel_prebuild(context)
     
     await query.edit_message_text(
         f"🎯 **الخطوات بالتسلسل**\n\n"
@@ -88,37 +111,43 @@ async def step_navigation_handler(update: Update, context: ContextTypes.DEFAULT_
         await update.effective_message.reply_text(config.ERROR_MESSAGES['no_session'])
         return
     
-    # Get current step
-    current_step = session_mgr.get_current_step(session_id)
-    total_steps = step_gen.get_total_steps()
-    
-    # Handle button action
-    if query.data == "step_next":
-        new_step = min(current_step + 1, total_steps)
-    elif query.data == "step_prev":
-        new_step = max(current_step - 1, 1)
-    elif query.data == "step_end":
+    if query.data == "step_end":
         await _end_step_mode(update, context)
         return
-    else:
+    if query.data not in ("step_next", "step_prev"):
         return
     
-    # Delete previous step message if it exists
-    prev_msg_id = context.user_data.get('last_step_message_id')
-    if prev_msg_id:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id,
-                message_id=prev_msg_id
-            )
-        except:
-            pass  # Message might be already deleted
-    
-    # Update session
-    session_mgr.set_current_step(session_id, new_step)
-    
-    # Show new step
-    await _show_step(update.effective_message, context, new_step)
+    async with _SESSION_LOCKS[session_id]:
+        # Get current step
+        current_step = session_mgr.get_current_step(session_id)
+        total_steps = step_gen.get_total_steps()
+        
+        # Handle button action
+        if query.data == "step_next":
+            new_step = min(current_step + 1, total_steps)
+        else:
+            new_step = max(current_step - 1, 1)
+        
+        # Already at the first/last step - nothing to save, delete or redraw
+        if new_step == current_step:
+            return
+        
+        # Update session
+        session_mgr.set_current_step(session_id, new_step)
+        
+        # Delete previous step message if it exists
+        prev_msg_id = context.user_data.get('last_step_message_id')
+        if prev_msg_id:
+            try:
+                await context.bot.delete_message(
+                    chat_id=update.effective_chat.id,
+                    message_id=prev_msg_id
+                )
+            except:
+                pass  # Message might be already deleted
+        
+        # Show new step
+        await _show_step(update.effective_message, context, new_step)
 
 
 async def step_color_edit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -152,11 +181,8 @@ async def step_color_edit_handler(update: Update, context: ContextTypes.DEFAULT_
         
     elif callback_data == "color_show_all":
         # Show all colors
-        from process import STANDARD_YARN_PALETTE
-        all_colors = list(STANDARD_YARN_PALETTE.keys())
-        
         await query.edit_message_reply_markup(
-            reply_markup=get_color_picker_keyboard(all_colors, show_all=True)
+            reply_markup=get_color_picker_keyboard(None, show_all=True)
         )
         
     elif callback_data == "color_cancel":
@@ -173,26 +199,31 @@ async def step_color_edit_handler(update: Update, context: ContextTypes.DEFAULT_
         if not editing_step:
             return
         
-        # Apply color edit
-        step_gen = context.user_data.get('step_generator')
-        step_gen.apply_color_edit(editing_step, new_color)
-        
-        # Save edit to session
         session_id = context.user_data.get('session_id')
-        color_edits = session_mgr.get_color_edits(session_id)
-        color_edits[f'step_{editing_step}'] = {'new_color': new_color}
-        session_mgr.save_color_edits(session_id, color_edits)
-        
-        await query.edit_message_text(
-            f"{config.SUCCESS_MESSAGES['color_changed']}\n"
-            f"تم تغيير اللون في الخطوة {editing_step} إلى {new_color}"
-        )
-        
-        # Regenerate grid with edits
-        await _regenerate_pattern_with_edits(context)
-        
-        # Show updated step
-        await _show_step(update.effective_message, context, editing_step)
+        async with _SESSION_LOCKS[session_id]:
+            # Apply color edit
+            step_gen = context.user_data.get('step_generator')
+            step_gen.apply_color_edit(editing_step, new_color)
+            
+            # Save edit to session
+            color_edits = session_mgr.get_color_edits(session_id)
+            color_edits[f'step_{editing_step}'] = {'new_color': new_color}
+            session_mgr.save_color_edits(session_id, color_edits)
+            
+            await query.edit_message_text(
+                f"{config.SUCCESS_MESSAGES['color_changed']}\n"
+                f"تم تغيير اللون في الخطوة {editing_step} إلى {new_color}"
+            )
+            
+            # Regenerate grid with edits
+            try:
+                await _regenerate_pattern_with_edits(context, editing_step)
+            except FileNotFoundError:
+                await update.effective_message.reply_text(config.ERROR_MESSAGES['no_session'])
+                return
+            
+            # Show updated step
+            await _show_step(update.effective_message, context, editing_step)
 
 
 async def _show_step(message, context, step_number):
@@ -207,30 +238,144 @@ async def _show_step(message, context, step_number):
     step = step_gen.get_step(step_number)
     total_steps = step_gen.get_total_steps()
     
-    # Create composite image
-    composite = composite_creator.create_step_image(step)
+    caption = (f"**الصف {step['row']} - الخطوة {step_number} من {total_steps}**\n\n"
+               f"{step['instruction_ar']}")
+    reply_markup = get_step_navigation_keyboard(step_number, total_steps)
     
-    # Save temporarily
-    import os
-    composite_path = os.path.join(config.TEMP_DIR, f"{session_id}_step_{step_number}.png")
-    composite.save(composite_path)
+    # Telegram file_id of this step's composite, if already uploaded
+    file_ids = context.user_data.setdefault('step_file_ids', {})
+    file_id = file_ids.get(step_number)
     
-    # Send image with instruction
-    with open(composite_path, 'rb') as img_file:
+    if file_id:
+        # Revisit - resend the uploaded photo, no render or upload
+        result = await message.reply_photo(
+            photo=file_id,
+            caption=caption,
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+    else:
+        # Prebuilt by _prebuild_steps, or render now - either way PNG bytes in memory
+        png = context.user_data.get('step_blobs', {}).pop(step_number, None)
+        if png is None:
+            png = _render_step_png(composite_creator, step)
+        
+        # Send image with instruction
         result = await message.reply_photo(
-            photo=img_file,
-            caption=f"**الصف {step['row']} - الخطوة {step_number} من {total_steps}**\n\n"
-                   f"{step['instruction_ar']}",
-            reply_markup=get_step_navigation_keyboard(step_number, total_steps),
+            photo=png,
+            caption=caption,
+            reply_markup=reply_markup,
             parse_mode='Markdown'
         )
+        file_ids[step_number] = result.photo[-1].file_id
+    
+    # Render the next few steps while the user reads this one
+    _schedule_prebuild(context, step_number + 1)
+    
+    # Still in use - keep the session's files from the TEMP_DIR sweep
+    _touch_files(
+        context.user_data.get('grid_path'),
+        context.user_data.get('palette_path'),
+        context.user_data.get('original_path'),
+    )
     
     # Store message ID for later deletion
     context.user_data['last_step_message_id'] = result.message_id
 
 
-async def _regenerate_pattern_with_edits(context):
-    """Regenerate pattern image with applied color edits"""
+def _touch_files(*paths):
+    """Bump the mtime of each existing path (None entries are skipped)"""
+    for path in paths:
+        if path:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # Already swept - the next load reports it
+
+
+def _open_loaded(path):
+    """Open an image and decode its pixels now rather than on first access"""
+    img = Image.open(path)
+    img.load()
+    return img
+
+
+async def _load_images(*paths):
+    """Open and decode images concurrently in worker threads"""
+    return await asyncio.gather(*(asyncio.to_thread(_open_loaded, path) for path in paths))
+
+
+def _render_step_png(composite_creator, step):
+    """Render one step composite to PNG bytes"""
+    # Transient upload - fast compression beats a smaller file here
+    buf = io.BytesIO()
+    composite_creator.create_step_image(step).save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+async def _prebuild_steps(context, step_gen, composite_creator, first_step):
+    """Render steps first_step.. ahead of time into context.user_data['step_blobs']"""
+    loop = asyncio.get_running_loop()
+    blobs = context.user_data.setdefault('step_blobs', {})
+    file_ids = context.user_data.get('step_file_ids', {})
+    
+    last_step = min(first_step + config.STEP_PREBUILD_AHEAD, step_gen.get_total_steps() + 1)
+    for step_number in range(first_step, last_step):
+        if step_number in blobs or step_number in file_ids:
+            continue
+        blobs[step_number] = await loop.run_in_executor(
+            None, _render_step_png, composite_creator, step_gen.get_step(step_number)
+        )
+
+
+def _schedule_prebuild(context, first_step):
+    """Start a background prebuild from first_step unless one is already running"""
+    task = context.user_data.get('prebuild_task')
+    if task and not task.done():
+        return
+    
+    step_gen = context.user_data.get('step_generator')
+    composite_creator = context.user_data.get('composite_creator')
+    if not step_gen or not composite_creator:
+        return
+    
+    # Own zoom cache - handlers may render with the original at the same time
+    composite_creator = copy.copy(composite_creator)
+    context.user_data['prebuild_task'] = context.application.create_task(
+        _prebuild_steps(context, step_gen, composite_creator, first_step)
+    )
+
+
+def _cancel_prebuild(context):
+    """Stop any background prebuild and drop its (now stale) results"""
+    task = context.user_data.pop('prebuild_task', None)
+    if task:
+        task.cancel()
+    context.user_data['step_blobs'] = {}
+
+
+def _forget_step_images(context, step_gen, edited_row):
+    """
+    Drop uploaded and prebuilt composites that show edited_row (1-indexed).
+    
+    A composite's zoom window spans at most ZOOM_ROWS rows around its own
+    row, so steps further away than that still render identically.
+    """
+    task = context.user_data.pop('prebuild_task', None)
+    if task:
+        task.cancel()
+    
+    def unaffected(step_number):
+        step = step_gen.get_step(step_number)
+        return step and abs(step['row'] - edited_row) >= CompositeImageCreator.ZOOM_ROWS
+    
+    for key in ('step_file_ids', 'step_blobs'):
+        cached = context.user_data.get(key, {})
+        context.user_data[key] = {n: v for n, v in cached.items() if unaffected(n)}
+
+
+async def _regenerate_pattern_with_edits(context, edited_step):
+    """Regenerate pattern image with applied color edits to edited_step"""
     step_gen = context.user_data.get('step_generator')
     grid_path = context.user_data.get('grid_path')
     session_id = context.user_data.get('session_id')
@@ -239,22 +384,29 @@ async def _regenerate_pattern_with_edits(context):
         return
     
     # Get updated pattern grid
-    from process import create_grid_pattern
-    from PIL import Image
-    
-    
     updated_grid = step_gen.get_pattern_grid()
     pattern_result = context.user_data.get('pattern_result')
     colors = pattern_result['colors']
     pattern_image = context.user_data.get('pattern_image')  # Get stored pattern image
     original_path = context.user_data.get('original_path')
     
+    if not original_path:
+        return
+    
+    # Load first, so a failure leaves the old creator and caches consistent
+    grid_image, original_image = await _load_images(grid_path, original_path)
+    
+    # Grid changed - prepared state and composites near the edit are stale
+    invalidate_prepared(session_id)
+    _forget_step_images(context, step_gen, step_gen.get_step(edited_step)['row'])
+    
     # Update composite creator with pattern_image
     context.user_data['composite_creator'] = CompositeImageCreator(
-        Image.open(grid_path),
-        Image.open(original_path),
+        grid_image,
+        original_image,
         updated_grid,
-        pattern_image=pattern_image  # Pass pattern image!
+        pattern_image=pattern_image,  # Pass pattern image!
+        pattern_id=session_id
     )
 
 
@@ -275,11 +427,15 @@ async def _end_step_mode(update, context):
     
     # Send final pattern images
     if grid_path and palette_path:
-        with open(grid_path, 'rb') as grid_file:
-            await update.effective_message.reply_photo(
-                photo=grid_file,
-                caption="✅ المخطط النهائي"
-            )
+        try:
+            grid_data = await asyncio.to_thread(Path(grid_path).read_bytes)
+        except FileNotFoundError:
+            await update.effective_message.reply_text(config.ERROR_MESSAGES['no_session'])
+            return
+        await update.effective_message.reply_photo(
+            photo=grid_data,
+            caption="✅ المخطط النهائي"
+        )
         
 
 # === JUMP TO STEP HANDLERS ===
@@ -316,12 +472,13 @@ async def jump_to_step_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return 1  # Stay in state
             
-        # Update session
-        session_mgr.set_current_step(session_id, target_step)
-        
-        # Show the target step
-        # Note: We can't edit the user's text message, so we reply with a new photo message
-        await _show_step(update.message, context, target_step)
+        async with _SESSION_LOCKS[session_id]:
+            # Update session
+            session_mgr.set_current_step(session_id, target_step)
+            
+            # Show the target step
+            # Note: We can't edit the user's text message, so we reply with a new photo message
+            await _show_step(update.message, context, target_step)
         
         return ConversationHandler.END
         
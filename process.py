@@ -8,10 +8,18 @@ Converts cartoon images into pixel-perfect patterns with Arabic instructions
 import os
 import re
 import math
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, features
 import arabic_reshaper
 from bidi.algorithm import get_display
 
+try:
+    import cv2  # Optional: faster SIMD median filter
+except ImportError:
+    cv2 = None
+
 FONT_PATH = "fonts/Arial.ttf" #this path do exist
 CELL_SIZE = 20  # Scale factor for grid visualization
 
@@ -74,6 +82,16 @@ STANDARD_YARN_PALETTE = {
     "لافندر": (230, 230, 250),
 }
 
+# Color extraction for suggestions: libimagequant (C, better centroids on
+# small vivid regions) when Pillow was built with it, else median cut
+SUGGEST_QUANTIZE_METHOD = (
+    Image.Quantize.LIBIMAGEQUANT if features.check("libimagequant")
+    else Image.Quantize.MEDIANCUT
+)
+
+# Reverse lookup RGB -> name (duplicate RGBs keep the last name)
+_RGB_TO_NAME = {rgb: name for name, rgb in STANDARD_YARN_PALETTE.items()}
+
 # ===== Lab Color Space Functions =====
 def rgb_to_lab(rgb):
     """Convert RGB to Lab color space for perceptually accurate color comparison"""
@@ -101,18 +119,105 @@ def rgb_to_lab(rgb):
 
     return (L, a, b_lab)
 
-def color_distance_lab(rgb1, rgb2):
-    """Calculate perceptual color distance using Lab color space (Delta E)"""
+def rgb_array_to_lab(rgb):
+    """Vectorized rgb_to_lab: (N, 3) RGB array -> (N, 3) float64 Lab array"""
+    c = np.asarray(rgb, dtype=np.float64).reshape(-1, 3) / 255.0
+
+    # RGB to XYZ
+    c = np.where(c > 0.04045, np.power((c + 0.055) / 1.055, 2.4), c / 12.92)
+    r, g, b = c[:, 0], c[:, 1], c[:, 2]
+
+    x = r * 0.4124 + g * 0.3576 + b * 0.1805
+    y = r * 0.2126 + g * 0.7152 + b * 0.0722
+    z = r * 0.0193 + g * 0.1192 + b * 0.9505
+
+    # XYZ to Lab (D65 illuminant)
+    xyz = np.stack([x / 0.95047, y / 1.00000, z / 1.08883], axis=1)
+    f = np.where(xyz > 0.008856, np.power(xyz, 1/3), (7.787 * xyz) + (16/116))
+
+    return np.stack([
+        (116 * f[:, 1]) - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], axis=1)
+
+NEAREST_CHUNK = 16384  # Colors per nearest_palette block (bounds the N x K temp)
+
+# Threads for large nearest_palette calls, created on first use. NumPy
+# releases the GIL in the distance math, so blocks really run in parallel
+_nearest_pool = None
+
+def _get_nearest_pool():
+    global _nearest_pool
+    if _nearest_pool is None:
+        _nearest_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return _nearest_pool
+
+def _nearest_block(lab, palette_lab):
+    dist = ((lab[:, None, :] - palette_lab[None, :, :]) ** 2).sum(axis=2)
+    return dist.argmin(axis=1)
+
+def nearest_palette(lab, palette_lab):
+    """
+    Index of the closest palette color (squared Delta E) for each Lab color.
+
+    Large inputs are split into NEAREST_CHUNK blocks, spread over threads
+    when there is more than one CPU.
+
+    Args:
+        lab: (N, 3) Lab array
+        palette_lab: (K, 3) Lab array
+
+    Returns:
+        (N,) int array; ties go to the first palette entry, like a strict <
+    """
+    if len(lab) <= NEAREST_CHUNK:
+        return _nearest_block(lab, palette_lab)
+
+    blocks = [lab[i:i + NEAREST_CHUNK] for i in range(0, len(lab), NEAREST_CHUNK)]
+    if (os.cpu_count() or 1) > 1:
+        results = _get_nearest_pool().map(_nearest_block, blocks, [palette_lab] * len(blocks))
+    else:
+        results = (_nearest_block(block, palette_lab) for block in blocks)
+    return np.concatenate(list(results))
+
+# Standard palette as arrays, with Lab computed once at import
+_PALETTE_NAMES = list(STANDARD_YARN_PALETTE)
+_PALETTE_RGB = np.array(list(STANDARD_YARN_PALETTE.values()), dtype=np.uint8)
+_PALETTE_LAB = rgb_array_to_lab(_PALETTE_RGB)
+
+def color_distance_lab_sq(rgb1, rgb2):
+    """
+    Squared Delta E (CIE76) between two RGB colors.
+
+    Orders colors the same as color_distance_lab without the sqrt - use it
+    for nearest-color searches and compare thresholds against threshold**2.
+    """
     lab1 = rgb_to_lab(rgb1)
     lab2 = rgb_to_lab(rgb2)
 
-    # Delta E (CIE76 formula)
-    return math.sqrt(
+    return (
         (lab1[0] - lab2[0])**2 +
         (lab1[1] - lab2[1])**2 +
         (lab1[2] - lab2[2])**2
     )
 
+def color_distance_lab(rgb1, rgb2):
+    """Calculate perceptual color distance using Lab color space (Delta E)"""
+    # Delta E (CIE76 formula)
+    return math.sqrt(color_distance_lab_sq(rgb1, rgb2))
+
+# ===== Fonts =====
+@lru_cache(maxsize=32)
+def load_font(path, size):
+    """Load a TrueType font once per (path, size), falling back to PIL's default"""
+    try:
+        if path and os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    except Exception:
+        pass
+    return ImageFont.load_default()
+
 # ===== Arabic Text Helper =====
 def text_arabic(text):
     """
@@ -148,29 +253,33 @@ def get_closest_color_name(rgb):
         return f"مفهرس {rgb}"
 
     r, g, b = rgb
-
-    # Convert RGB to HSV for perceptually accurate color naming
-    r_norm, g_norm, b_norm = r/255.0, g/255.0, b/255.0
-    max_val = max(r_norm, g_norm, b_norm)
-    min_val = min(r_norm, g_norm, b_norm)
+    return _closest_color_name(int(r), int(g), int(b))
+
+@lru_cache(maxsize=65536)
+def _closest_color_name(r, g, b):
+    """HSV decision tree behind get_closest_color_name, cached per RGB"""
+    # Convert RGB to HSV for perceptually accurate color naming.
+    # Ratios of channel differences don't need /255 - work on the ints
+    max_val = max(r, g, b)
+    min_val = min(r, g, b)
     diff = max_val - min_val
 
     # Calculate HSV
     # Hue (0-360)
     if diff == 0:
         hue = 0
-    elif max_val == r_norm:
-        hue = (60 * ((g_norm - b_norm) / diff) + 360) % 360
-    elif max_val == g_norm:
-        hue = (60 * ((b_norm - r_norm) / diff) + 120) % 360
+    elif max_val == r:
+        hue = (60 * (g - b) / diff + 360) % 360
+    elif max_val == g:
+        hue = (60 * (b - r) / diff + 120) % 360
     else:
-        hue = (60 * ((r_norm - g_norm) / diff) + 240) % 360
+        hue = (60 * (r - g) / diff + 240) % 360
 
     # Saturation (0-1)
     saturation = 0 if max_val == 0 else diff / max_val
 
     # Value/Brightness (0-1)
-    value = max_val
+    value = max_val / 255
 
     # === Decision Tree for Color Naming ===
 
@@ -265,6 +374,46 @@ def get_closest_color_name(rgb):
         return "وردي"
 
 
+# ===== Packed RGB Keys =====
+def _pack_rgb(arr):
+    """Pack an (..., 3) uint8 RGB array into (...) uint32 keys r<<16 | g<<8 | b"""
+    arr = np.asarray(arr).astype(np.uint32)
+    return (arr[..., 0] << 16) | (arr[..., 1] << 8) | arr[..., 2]
+
+def _unpack_rgb(keys):
+    """Inverse of _pack_rgb: (N,) uint32 keys -> (N, 3) uint8 RGB"""
+    return np.stack([keys >> 16, (keys >> 8) & 0xFF, keys & 0xFF], axis=1).astype(np.uint8)
+
+# ===== Smoothing =====
+def median3(image):
+    """
+    3x3 median filter of an RGB PIL image, returned as an (H, W, 3) uint8 array.
+
+    Uses OpenCV's histogram-based medianBlur when cv2 is installed, else
+    PIL's MedianFilter.
+    """
+    if cv2 is not None:
+        return cv2.medianBlur(np.asarray(image), 3)
+    return np.asarray(image.filter(ImageFilter.MedianFilter(size=3)))
+
+# ===== Color Remapping Helper =====
+def _apply_color_map(image, color_map):
+    """
+    Recolor an RGB image through an {old_rgb: new_rgb} dict (missing colors stay).
+
+    Looks each distinct color up once (as a packed r<<16 | g<<8 | b key), then
+    expands back to pixels with the np.unique inverse instead of touching
+    pixels one by one.
+    """
+    arr = np.asarray(image, dtype=np.uint8)
+    unique_keys, inverse = np.unique(_pack_rgb(arr).ravel(), return_inverse=True)
+
+    lut = np.array(
+        [color_map.get(rgb, rgb) for rgb in map(tuple, _unpack_rgb(unique_keys).tolist())],
+        dtype=np.uint8
+    ).reshape(-1, 3)
+    return Image.fromarray(lut[inverse.reshape(-1)].reshape(arr.shape))
+
 # ===== Color Similarity Merger =====
 def merge_similar_colors(image, threshold=10):
     """
@@ -278,7 +427,6 @@ def merge_similar_colors(image, threshold=10):
         PIL Image with merged colors
     """
     width, height = image.size
-    pixels = image.load()
 
     # Get all unique colors
     colors = image.getcolors(width * height)
@@ -289,42 +437,24 @@ def merge_similar_colors(image, threshold=10):
     colors.sort(key=lambda x: x[0], reverse=True)
 
     # Build color mapping: similar_color -> dominant_color
-    color_map = {}
+    points = np.array([rgb for count, rgb in colors], dtype=np.int32)
+    threshold_sq = threshold * threshold
+    dominant = np.full(len(colors), -1)  # Index of each color's dominant color
 
-    for i, (count_i, rgb_i) in enumerate(colors):
-        if rgb_i in color_map:
+    for i in range(len(colors)):
+        if dominant[i] >= 0:
             continue  # Already mapped
 
-        # This color is dominant (not yet mapped)
-        color_map[rgb_i] = rgb_i
+        # This color is dominant (not yet mapped): take every unmapped color
+        # within threshold (itself included) - one vectorized distance pass,
+        # compared squared in integers
+        distance_sq = ((points - points[i]) ** 2).sum(axis=1)
+        dominant[(dominant < 0) & (distance_sq <= threshold_sq)] = i
 
-        # Find all similar colors and map them to this dominant one
-        for j, (count_j, rgb_j) in enumerate(colors):
-            if i == j or rgb_j in color_map:
-                continue
-
-            # Calculate Euclidean distance
-            distance = math.sqrt(
-                (rgb_i[0] - rgb_j[0])**2 +
-                (rgb_i[1] - rgb_j[1])**2 +
-                (rgb_i[2] - rgb_j[2])**2
-            )
-
-            # If similar enough, map to dominant color
-            if distance <= threshold:
-                color_map[rgb_j] = rgb_i
+    color_map = {rgb: colors[d][1] for (count, rgb), d in zip(colors, dominant)}
 
     # Apply color mapping to entire image
-    new_image = Image.new("RGB", (width, height))
-    new_pixels = new_image.load()
-
-    for y in range(height):
-        for x in range(width):
-            old_color = pixels[x, y]
-            new_color = color_map.get(old_color, old_color)
-            new_pixels[x, y] = new_color
-
-    return new_image
+    return _apply_color_map(image, color_map)
 
 # ===== Perceptual Color Merger (by Name) =====
 def merge_colors_by_name(image):
@@ -339,7 +469,6 @@ def merge_colors_by_name(image):
         PIL Image with name-duplicates merged
     """
     width, height = image.size
-    pixels = image.load()
 
     # Get all unique colors
     colors = image.getcolors(width * height)
@@ -370,16 +499,7 @@ def merge_colors_by_name(image):
 
 
     # Apply color mapping to entire image
-    new_image = Image.new("RGB", (width, height))
-    new_pixels = new_image.load()
-
-    for y in range(height):
-        for x in range(width):
-            old_color = pixels[x, y]
-            new_color = color_map.get(old_color, old_color)
-            new_pixels[x, y] = new_color
-
-    return new_image
+    return _apply_color_map(image, color_map)
 
 # ===== Map Image to User's Yarn Palette =====
 def map_to_user_palette(image, user_colors):
@@ -388,14 +508,14 @@ def map_to_user_palette(image, user_colors):
     Uses Lab color space for perceptually accurate matching.
 
     Args:
-        image: PIL Image in RGB mode
+        image: PIL Image in RGB mode, or an (H, W, 3) uint8 array
         user_colors: List of color names that the user has (e.g., ["أحمر", "أزرق", "بني"])
 
     Returns:
-        PIL Image with all pixels mapped to user's palette
+        Image with all pixels mapped to user's palette - a PIL Image, or an
+        (H, W, 3) uint8 array if an array was passed in
     """
-    width, height = image.size
-    pixels = image.load()
+    as_array = isinstance(image, np.ndarray)
 
     # Build user's palette from selected colors
     user_palette = {}
@@ -409,31 +529,21 @@ def map_to_user_palette(image, user_colors):
 
     print(f"✅ الألوان المتاحة: {len(user_palette)} لون")
 
-    # Create new image
-    new_image = Image.new("RGB", (width, height))
-    new_pixels = new_image.load()
+    palette_rgb = np.array(list(user_palette.values()), dtype=np.uint8)
+    palette_lab = rgb_array_to_lab(palette_rgb)
 
-    # Map each pixel to closest user color (using Lab distance)
-    for y in range(height):
-        for x in range(width):
-            pixel_rgb = pixels[x, y]
+    # Find the closest user color (Lab distance) once per distinct pixel
+    # color - images after smoothing have far fewer colors than pixels
+    arr = np.asarray(image, dtype=np.uint8)
+    unique_keys, inverse = np.unique(_pack_rgb(arr).ravel(), return_inverse=True)
+    nearest = nearest_palette(rgb_array_to_lab(_unpack_rgb(unique_keys)), palette_lab)
 
-            # Find closest color from user's palette
-            min_distance = float('inf')
-            closest_color = list(user_palette.values())[0]
-
-            for color_rgb in user_palette.values():
-                distance = color_distance_lab(pixel_rgb, color_rgb)
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_color = color_rgb
-
-            new_pixels[x, y] = closest_color
-
-    return new_image
+    # Palette lookup writes the output buffer directly
+    mapped = palette_rgb[nearest[inverse.reshape(-1)]].reshape(arr.shape)
+    return mapped if as_array else Image.fromarray(mapped)
 
 # ===== Auto-Suggest Colors from Image =====
-def suggest_colors_from_image(image_path, max_suggested=10):
+def suggest_colors_from_image(image_path, max_suggested=10, image=None):
     """
     NEW APPROACH: Analyze ACTUAL colors in image, then match to palette.
 
@@ -448,12 +558,19 @@ def suggest_colors_from_image(image_path, max_suggested=10):
     Args:
         image_path: Path to the image file
         max_suggested: Maximum number of colors to suggest
+        image: Optional already-decoded RGB PIL image of image_path - saves
+            decoding the file again (the image itself is not modified)
 
     Returns:
         List of suggested color names sorted by importance
     """
-    # Load image
-    img = Image.open(image_path).convert("RGB")
+    if image is not None:
+        img = image.copy()
+    else:
+        # Load image - JPEGs decode straight at a reduced scale (still >= 400 px)
+        img = Image.open(image_path)
+        img.draft("RGB", (400, 400))
+        img = img.convert("RGB")
 
     # Resize for analysis (keep details, not too small)
     img.thumbnail((400, 400), Image.Resampling.LANCZOS)
@@ -468,7 +585,7 @@ def suggest_colors_from_image(image_path, max_suggested=10):
 
     try:
         # Quantize to find dominant colors
-        quantized = img.quantize(colors=num_extract, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        quantized = img.quantize(colors=num_extract, method=SUGGEST_QUANTIZE_METHOD, dither=Image.Dither.NONE)
 
         # Get the palette (list of RGB values)
         palette_data = quantized.getpalette()
@@ -490,27 +607,28 @@ def suggest_colors_from_image(image_path, max_suggested=10):
 
     except Exception as e:
         print(f"⚠️ Quantization failed, using fallback: {e}")
-        # Fallback: sample pixels directly
-        pixels = list(img.getdata())
-        from collections import Counter
-        pixel_counts = Counter(pixels).most_common(num_extract)
-        actual_colors = [(rgb, count) for rgb, count in pixel_counts]
+        # Fallback: count pixel colors directly from the image buffer -
+        # most common first, ties in order of first appearance
+        keys, first_seen, counts = np.unique(
+            _pack_rgb(np.asarray(img)).ravel(), return_index=True, return_counts=True
+        )
+        top = np.lexsort((first_seen, -counts))[:num_extract]
+        actual_colors = [
+            (tuple(rgb), count)
+            for rgb, count in zip(_unpack_rgb(keys[top]).tolist(), counts[top].tolist())
+        ]
 
     # === STEP 2: Match each actual color to closest palette color ===
     # This is the KEY difference: we're matching ACTUAL colors, not every pixel
 
     palette_matches = {}  # palette_name -> (total_count, actual_rgb_that_matched)
 
-    for actual_rgb, count in actual_colors:
-        # Find closest palette color for this ACTUAL color
-        min_distance = float('inf')
-        closest_name = None
+    # Closest palette color for every ACTUAL color in one shot
+    actual_lab = rgb_array_to_lab([rgb for rgb, count in actual_colors])
+    closest = nearest_palette(actual_lab, _PALETTE_LAB)
 
-        for name, palette_rgb in STANDARD_YARN_PALETTE.items():
-            distance = color_distance_lab(actual_rgb, palette_rgb)
-            if distance < min_distance:
-                min_distance = distance
-                closest_name = name
+    for (actual_rgb, count), idx in zip(actual_colors, closest):
+        closest_name = _PALETTE_NAMES[idx]
 
         if closest_name:
             if closest_name in palette_matches:
@@ -549,7 +667,9 @@ def parse_input():
 
     # === AUTO-SUGGEST COLORS ===
     print("🔍 تحليل الصورة...")
-    suggested_colors = suggest_colors_from_image(img_path, max_suggested=12)
+    # Decode once - the suggestion pass and process_image share this image
+    image = Image.open(img_path).convert("RGB")
+    suggested_colors = suggest_colors_from_image(img_path, max_suggested=12, image=image)
 
     print(f"\n✨ الألوان المقترحة ({len(suggested_colors)} لون):")
     print("   " + ", ".join(suggested_colors))
@@ -573,7 +693,7 @@ def parse_input():
             user_colors = suggested_colors
             print(f"⚠️  استخدام جميع الألوان الافتراضية ({len(user_colors)} لون)")
 
-    return img_path, is_knitting, longest_side, user_colors
+    return img_path, is_knitting, longest_side, user_colors, image
 
 
 # ===== Main Processing Function =====
@@ -581,7 +701,7 @@ def process_image():
     """Main image processing pipeline"""
 
     # Parse input
-    img_path, is_knitting, longest_side, user_colors = parse_input()
+    img_path, is_knitting, longest_side, user_colors, original_image = parse_input()
 
     # Validate file exists
     if not os.path.exists(img_path):
@@ -593,8 +713,7 @@ def process_image():
     print(f"📏 الحجم: {longest_side} غرزة")
     print(f"🎨 الألوان: {', '.join(user_colors)}\n")
 
-    # Load image
-    original_image = Image.open(img_path).convert("RGB")
+    # Image was already decoded by parse_input
     orig_width, orig_height = original_image.size
 
     # Calculate target dimensions
@@ -618,12 +737,13 @@ def process_image():
     # === STEP 2: Smooth out JPEG artifacts and anti-aliasing ===
     # This prevents solid regions from splitting into multiple colors
     print("🧹 تنعيم الصورة...")
-    from PIL import ImageFilter
-    smoothed_image = resized_image.filter(ImageFilter.MedianFilter(size=3))
+    smoothed = median3(resized_image)
 
     # === STEP 3: Map to user's yarn palette ===
+    # Stays a uint8 array from here on; PIL only wraps it for drawing/saving
     print("🎨 تطبيق الألوان المتاحة...")
-    final_image = map_to_user_palette(smoothed_image, user_colors)
+    final_pixels = map_to_user_palette(smoothed, user_colors)
+    final_image = Image.fromarray(final_pixels)
 
     # === Extract color palette ===
     colors = final_image.getcolors(new_width * new_height)
@@ -634,18 +754,16 @@ def process_image():
     # Sort by frequency (most common first)
     colors.sort(key=lambda x: x[0], reverse=True)
 
-    # Create color map: RGB -> (color_id, color_name, count)
+    # Create color map: packed RGB (r<<16 | g<<8 | b) -> (color_id, color_name, count)
+    # Int keys hash faster than RGB tuples and match _pack_rgb for the row pass
     color_map = {}
     print("\n🎨 الألوان المستخدمة:")
 
-    # Build reverse lookup from STANDARD_YARN_PALETTE
-    rgb_to_name = {rgb: name for name, rgb in STANDARD_YARN_PALETTE.items()}
-
     for i, (count, rgb) in enumerate(colors):
         color_id = i + 1
         # Direct lookup from standard palette (exact match!)
-        color_name = rgb_to_name.get(rgb, f"لون مخصص RGB{rgb}")
-        color_map[rgb] = (color_id, color_name, count)
+        color_name = _RGB_TO_NAME.get(rgb, f"لون مخصص RGB{rgb}")
+        color_map[(rgb[0] << 16) | (rgb[1] << 8) | rgb[2]] = (color_id, color_name, count)
         print(f"  {color_id}. {color_name} - {count} غرزة - RGB{rgb}")
 
     # === Generate Grid Image ===
@@ -653,15 +771,16 @@ def process_image():
     grid_width = new_width * CELL_SIZE
     grid_height = new_height * CELL_SIZE
 
-    grid_image = final_image.resize((grid_width, grid_height), Image.Resampling.NEAREST)
-    draw = ImageDraw.Draw(grid_image)
+    # Each stitch becomes a CELL_SIZE x CELL_SIZE block
+    grid_pixels = np.repeat(np.repeat(final_pixels, CELL_SIZE, axis=0), CELL_SIZE, axis=1)
 
-    # Draw grid lines
+    # Draw grid lines: every CELL_SIZE-th row and column in two strided writes
     grid_color = (200, 200, 200)
-    for x in range(0, grid_width, CELL_SIZE):
-        draw.line([(x, 0), (x, grid_height)], fill=grid_color, width=1)
-    for y in range(0, grid_height, CELL_SIZE):
-        draw.line([(0, y), (grid_width, y)], fill=grid_color, width=1)
+    grid_pixels[:, ::CELL_SIZE] = grid_color
+    grid_pixels[::CELL_SIZE, :] = grid_color
+
+    grid_image = Image.fromarray(grid_pixels)
+    draw = ImageDraw.Draw(grid_image)
 
     # Draw border
     draw.rectangle([(0, 0), (grid_width - 1, grid_height - 1)], outline="black", width=3)
@@ -694,7 +813,7 @@ def process_image():
         font = ImageFont.load_default()
 
     for i, (count, rgb) in enumerate(colors):
-        color_id, color_name, _ = color_map[rgb]
+        color_id, color_name, _ = color_map[(rgb[0] << 16) | (rgb[1] << 8) | rgb[2]]
 
         row = i // palette_cols
         col = i % palette_cols
@@ -720,44 +839,41 @@ def process_image():
     # === Generate Row-by-Row Text Instructions ===
     print("\n📝 تعليمات الصفوف:\n")
 
-    pixels = final_image.load()
+    # Reverse even rows (zig-zag pattern for knitting/crochet)
+    row_keys = _pack_rgb(final_pixels)
+    row_keys[1::2] = row_keys[1::2, ::-1]
+
+    # Palette names are pure Arabic, so the BiDi display of a whole row is
+    # its displayed segments in reverse order, then the displayed "صف N: "
+    # prefix - and a displayed "count×name" segment is the shaped name, "×",
+    # then the count. Shape each name once instead of every row. Custom
+    # "RGB(...)" names mix in Latin text and need the whole-row pass.
+    shaped_names = None
+    if all(name in STANDARD_YARN_PALETTE for _, name, _ in color_map.values()):
+        shaped_names = {key: text_arabic(name) for key, (_, name, _) in color_map.items()}
 
+    lines = []
     for row in range(new_height):
         row_num = row + 1
-        row_data = []
+        row_data = row_keys[row]
 
-        # Read pixels for this row
-        for col in range(new_width):
-            rgb = pixels[col, row]
-            row_data.append(rgb)
-
-        # Reverse even rows (zig-zag pattern for knitting/crochet)
-        if row_num % 2 == 0:
-            row_data = row_data[::-1]
+        # Run-length encode: a run starts wherever the color changes
+        starts = np.r_[0, np.flatnonzero(np.diff(row_data)) + 1]
+        counts = np.diff(np.r_[starts, len(row_data)])
+        runs = list(zip(counts.tolist(), row_data[starts].tolist()))
 
         # Build instruction string
-        instructions = []
-        current_color = None
-        current_count = 0
+        if shaped_names is not None:
+            lines.append(
+                " + ".join(f"{shaped_names[key]}×{count}" for count, key in reversed(runs))
+                + text_arabic(f"صف {row_num}: ")
+            )
+        else:
+            instructions = [f"{count}×{color_map[key][1]}" for count, key in runs]
+            lines.append(text_arabic(f"صف {row_num}: " + " + ".join(instructions)))
 
-        for rgb in row_data:
-            if rgb == current_color:
-                current_count += 1
-            else:
-                if current_color is not None:
-                    color_id, color_name, _ = color_map[current_color]
-                    instructions.append(f"{current_count}×{color_name}")
-                current_color = rgb
-                current_count = 1
-
-        # Add last segment
-        if current_color is not None:
-            color_id, color_name, _ = color_map[current_color]
-            instructions.append(f"{current_count}×{color_name}")
-
-        # Print row instruction
-        instruction_text = f"صف {row_num}: " + " + ".join(instructions)
-        print(text_arabic(instruction_text))
+    # Print all row instructions at once
+    print("\n".join(lines))
 
     print("\n✅ اكتمل التحويل!")
     print(f"📊 إجمالي: {new_height} صف × {new_width} غرزة = {new_width * new_height} غرزة")
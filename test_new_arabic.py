@@ -4,27 +4,24 @@
 Test the NEW Arabic rendering approach for PIL images
 """
 
-from PIL import Image, ImageDraw, ImageFont
-import arabic_reshaper
-import os
+from PIL import Image, ImageDraw
+import sys
+
+sys.path.insert(0, '.')
+from core.arabic_cache import reshape
+from process import load_font
 
 def text_arabic_NEW(text):
     """New approach: reshape + reverse"""
-    reshaped = arabic_reshaper.reshape(text)
+    reshaped = reshape(text)
     return reshaped[::-1]
 
 # Create test image
 img = Image.new('RGB', (400, 200), 'white')
 draw = ImageDraw.Draw(img)
 
-# Try to load font
-try:
-    if os.path.exists("fonts/Arial.ttf"):
-        font = ImageFont.truetype("fonts/Arial.ttf", 30)
-    else:
-        font = ImageFont.load_default()
-except:
-    font = ImageFont.load_default()
+# Try to load font (cached per path and size)
+font = load_font("fonts/Arial.ttf", 30)
 
 # Test Arabic words
 test_words = [
@@ -46,7 +43,7 @@ for word in test_words:
     y_pos += 80
 
 # Save
-img.save("arabic_test_NEW.png")
+img.save("arabic_test_NEW.png", compress_level=1)
 print("✅ Saved: arabic_test_NEW.png")
 print("\nCheck this image - the BLUE text should show correct Arabic!")
 print("- Connected letters ✅")
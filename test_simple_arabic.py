@@ -2,19 +2,18 @@
 # -*- coding: utf-8 -*-
 """Quick test to see what text_arabic produces"""
 
-import arabic_reshaper
-from bidi.algorithm import get_display
+import sys
+
+sys.path.insert(0, '.')
+from core.arabic_cache import shape_arabic
 
 def test_simple():
     original = "بيضاء"
     
-    # Step 1: Reshape
-    reshaped = arabic_reshaper.reshape(original)
+    # Step 1: Reshape, Step 2: BiDi (one shared, memoized pass)
+    reshaped, final = shape_arabic(original)
     print(f"Original: {original}")
     print(f"After reshape: {reshaped}")
-    
-    # Step 2: BiDi
-    final = get_display(reshaped)
     print(f"After bidi: {final}")
     
     # Check if they're different